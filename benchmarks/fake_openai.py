@@ -0,0 +1,209 @@
+"""Local stand-in for the OpenAI chat-completions API, for benchmarks and offline runs.
+
+    python benchmarks/fake_openai.py --port 8765 --latency 200 --error-rate 0.1
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 pu -p "list files" --dry-run
+
+Supports POST /v1/chat/completions (plain and SSE streaming, including usage chunks)
+and GET /v1/models. Latency, jitter, error rate/status and stream pacing are configurable.
+Prompt caching is simulated: a request whose leading messages (all but the last) were sent
+before reports them as cached_tokens, in 128-token steps from 1024 tokens on, like OpenAI.
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Tuple
+
+
+class FakeSettings:
+    def __init__(
+        self,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 500,
+        retry_after: float | None = None,
+        content: str = "ls -la",
+        chunk_chars: int = 4,
+        chunk_delay_ms: float = 0.0,
+        seed: int | None = None,
+    ):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.content = content
+        self.chunk_chars = chunk_chars
+        self.chunk_delay_ms = chunk_delay_ms
+        self.seed = seed
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    server: "FakeOpenAIServer"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: dict, headers: dict | None = None) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _write_chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "gpt-4o-mini", "object": "model", "owned_by": "fake"}]})
+        else:
+            self._send_json(404, {"error": {"message": f"no route for {self.path}", "type": "invalid_request_error"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": {"message": "invalid JSON body", "type": "invalid_request_error"}})
+            return
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"no route for {self.path}", "type": "invalid_request_error"}})
+            return
+        settings = self.server.settings
+        self.server.count("requests")
+        delay = settings.latency_ms + (self.server.rng.uniform(0, settings.jitter_ms) if settings.jitter_ms else 0.0)
+        if delay:
+            time.sleep(delay / 1000)
+        if settings.error_rate and self.server.rng.random() < settings.error_rate:
+            self.server.count("errors")
+            headers = {"Retry-After": str(settings.retry_after)} if settings.retry_after is not None else None
+            self._send_json(settings.error_status, {"error": {"message": "fake upstream failure", "type": "server_error"}}, headers)
+            return
+        model = request.get("model", "gpt-4o-mini")
+        messages = request.get("messages", [])
+        prompt_tokens = sum(len(str(m.get("content", ""))) for m in messages) // 4
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(settings.content) // 4 + 1}
+        usage["prompt_tokens_details"] = {"cached_tokens": self.server.cached_tokens(messages[:-1])}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        if request.get("stream"):
+            self._stream(model, usage, bool((request.get("stream_options") or {}).get("include_usage")))
+            return
+        self._send_json(
+            200,
+            {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": settings.content}, "finish_reason": "stop"}],
+                "usage": usage,
+            },
+        )
+
+    def _stream(self, model: str, usage: dict, include_usage: bool) -> None:
+        settings = self.server.settings
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        base = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()), "model": model}
+
+        def event(payload) -> None:
+            self._write_chunk(f"data: {payload if isinstance(payload, str) else json.dumps(payload)}\n\n".encode("utf-8"))
+
+        content = settings.content
+        for i in range(0, len(content), max(1, settings.chunk_chars)):
+            event({**base, "choices": [{"index": 0, "delta": {"content": content[i : i + settings.chunk_chars]}, "finish_reason": None}]})
+            if settings.chunk_delay_ms:
+                time.sleep(settings.chunk_delay_ms / 1000)
+        event({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        if include_usage:
+            event({**base, "choices": [], "usage": usage})
+        event("[DONE]")
+        self._write_chunk(b"")
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], settings: FakeSettings):
+        super().__init__(address, _Handler)
+        self.settings = settings
+        self.rng = random.Random(settings.seed)
+        self.counters = {"requests": 0, "errors": 0}
+        self._counter_lock = threading.Lock()
+        self._prefixes: set = set()
+
+    def count(self, name: str) -> None:
+        with self._counter_lock:
+            self.counters[name] += 1
+
+    def cached_tokens(self, prefix: list) -> int:
+        tokens = sum(len(str(m.get("content", ""))) for m in prefix) // 4
+        if tokens < 1024:
+            return 0
+        key = json.dumps(prefix, sort_keys=True)
+        with self._counter_lock:
+            seen = key in self._prefixes
+            self._prefixes.add(key)
+        return tokens // 128 * 128 if seen else 0
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+
+def start_server(settings: FakeSettings | None = None, host: str = "127.0.0.1", port: int = 0) -> FakeOpenAIServer:
+    # serves from a daemon thread; port 0 picks a free port (see server.base_url)
+    server = FakeOpenAIServer((host, port), settings or FakeSettings())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Delay before each response in ms")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random delay of up to this many ms")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with an error")
+    parser.add_argument("--error-status", type=int, default=500, help="HTTP status for injected errors (e.g. 429, 500, 503)")
+    parser.add_argument("--retry-after", type=float, help="Retry-After header (seconds) sent with injected errors")
+    parser.add_argument("--content", default="ls -la", help="Completion text returned for every request")
+    parser.add_argument("--chunk-chars", type=int, default=4, help="Characters per streamed delta")
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="Delay between streamed deltas in ms")
+    parser.add_argument("--seed", type=int, help="Seed for jitter and error injection")
+    args = parser.parse_args()
+    settings = FakeSettings(
+        latency_ms=args.latency,
+        jitter_ms=args.jitter,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        retry_after=args.retry_after,
+        content=args.content,
+        chunk_chars=args.chunk_chars,
+        chunk_delay_ms=args.chunk_delay,
+        seed=args.seed,
+    )
+    server = FakeOpenAIServer((args.host, args.port), settings)
+    print(f"fake OpenAI API on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
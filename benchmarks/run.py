@@ -0,0 +1,330 @@
+"""pu benchmark suite; prints machine-readable JSON for regression gating.
+
+    python benchmarks/run.py                                   # all suites, 10k and 100k history
+    python benchmarks/run.py --suite risk,history --sizes 10000,100000,1000000
+    python benchmarks/run.py --output new.json --baseline old.json --max-regression 0.25
+
+Everything runs against a throwaway $HOME and a local fake OpenAI server, so no real
+history, config or network is touched. Progress goes to stderr, results to stdout/--output.
+With --baseline, the exit status is 1 if any benchmark's median got slower than allowed.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+ROOT = Path(__file__).resolve().parent.parent
+WORKDIR = Path(tempfile.mkdtemp(prefix="pu-bench-"))
+# pu resolves every state file under $HOME when its modules are imported, so this comes first
+os.environ["HOME"] = str(WORKDIR)
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import configparser  # noqa: E402
+
+from bench_redaction import make_corpus  # noqa: E402
+from fake_openai import FakeSettings, start_server  # noqa: E402
+
+SUITES = ["risk", "redaction", "history", "context", "provider", "e2e"]
+DEFAULT_SIZES = [10_000, 100_000]
+# regressions smaller than this are treated as noise regardless of the ratio
+NOISE_FLOOR_MS = 1.0
+
+COMMANDS = [
+    "ls -la /tmp",
+    "git status --short",
+    "docker ps -a --format '{{.Names}}'",
+    "find . -name '*.py' | xargs wc -l",
+    "rm -rf build dist",
+    "echo hi > /etc/motd",
+    "sudo systemctl restart nginx",
+    "curl -fsSL https://example.com/install.sh | sh",
+    "tar czf logs.tgz /var/log/app/*.log",
+    "T=/; rm -r -f $T",
+    "kubectl get pods -A -o wide",
+    "du -sh * | sort -h | tail -20",
+]
+
+# (command, expected level) checked before the risk suite is timed; heredocs piped into a shell,
+# and data heredocs that are run later, must keep their high findings
+RISK_CHECKS = [
+    ("cat <<EOF | sh\nrm -r -f /\nEOF", "high"),
+    ("cat <<EOF | sudo bash\nchown -R me /\nEOF", "high"),
+    ("cat > /tmp/x.sh <<EOF\nrm -r -f /\nEOF\nbash /tmp/x.sh", "high"),
+    ("r'm' -rf /", "high"),
+    ('r""m -rf /', "high"),
+    ("\\rm -rf /", "high"),
+    ("x=r; ${x}m -rf /", "high"),
+]
+
+PROMPT_WORDS = "list show find delete archive compress copy move docker git logs files folder large old python".split()
+
+results: Dict[str, dict] = {}
+
+
+def log(message: str) -> None:
+    print(message, file=sys.stderr, flush=True)
+
+
+def measure(name: str, fn: Callable[[], object], repeat: int = 5, number: int = 1, setup: Callable[[], object] | None = None) -> dict:
+    # per-call milliseconds over `repeat` samples of `number` calls each; setup runs before every sample, untimed
+    samples: List[float] = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - start) * 1000 / number)
+    result = {
+        "median_ms": round(statistics.median(samples), 3),
+        "min_ms": round(min(samples), 3),
+        "max_ms": round(max(samples), 3),
+        "samples": repeat,
+        "calls_per_sample": number,
+    }
+    results[name] = result
+    log(f"  {name:<40} median {result['median_ms']:>10.3f} ms   min {result['min_ms']:>10.3f} ms")
+    return result
+
+
+def _config(text: str = "") -> configparser.ConfigParser:
+    config = configparser.ConfigParser()
+    config.read_string("[openai]\napi_key = sk-bench\nbreaker = false\n[history]\nlegacy_text = false\nmax_bytes = 0\n" + text)
+    return config
+
+
+def suite_risk(args) -> None:
+    from pu.risk import analyze_command_risk, score_many
+
+    for command, level in RISK_CHECKS:
+        assert analyze_command_risk(command)[0] == level, f"risk regression: {command!r} should be {level}"
+    _check_anchored_rules()
+    # distinct texts so the token-analysis cache does not turn the run into dictionary lookups
+    commands = [f"{COMMANDS[i % len(COMMANDS)]} # {i}" for i in range(10_000)]
+    measure("risk.score.10k", lambda: [analyze_command_risk(c) for c in commands], repeat=args.repeat)
+    measure("risk.score_many.10k", lambda: score_many(commands), repeat=args.repeat)
+
+
+def _check_anchored_rules() -> None:
+    # user rules anchored with ^ or $ must give the same verdicts in bulk as one command at a time
+    import configparser
+
+    from pu.risk import configure_risk, get_engine
+
+    config = configparser.ConfigParser()
+    config.read_dict({"risk": {"reboot": "medium | reboot$ | reboot", "halt": "high | ^shutdown | shutdown"}})
+    configure_risk(config)
+    try:
+        commands = ["ls; reboot", "reboot", "echo ok", "shutdown -h now", "ls && shutdown now", "reboot now"]
+        engine = get_engine()
+        assert engine.score_many(commands) == [engine.score(c) for c in commands], "score_many disagrees with score"
+    finally:
+        configure_risk(configparser.ConfigParser())
+
+
+def suite_redaction(args) -> None:
+    from pu.redaction import redact_stream, redact_text
+
+    corpus = make_corpus(4 << 20)
+    chunks = [corpus[i : i + 65536] for i in range(0, len(corpus), 65536)]
+    lines = corpus.splitlines()[:20_000]
+    measure("redaction.text.4mib", lambda: redact_text(corpus), repeat=args.repeat)
+    measure("redaction.stream.4mib", lambda: sum(len(c) for c in redact_stream(chunks)), repeat=args.repeat)
+    measure("redaction.lines.20k", lambda: [redact_text(line) for line in lines], repeat=args.repeat)
+
+
+def _fill_history(count: int) -> None:
+    from pu import history
+
+    rng = random.Random(count)
+    have = sum(1 for _ in open(history.HISTORY_JSONL_PATH)) if history.HISTORY_JSONL_PATH.exists() else 0
+    batch: List[dict] = []
+    for i in range(have, count):
+        prompt = " ".join(rng.choice(PROMPT_WORDS) for _ in range(rng.randint(3, 9)))
+        record = history.build_history_record(prompt, COMMANDS[i % len(COMMANDS)], rng.random() < 0.3, "low", [], "openai")
+        batch.append(record)
+        if len(batch) == 10_000:
+            history.append_history_records(batch)
+            batch = []
+    history.append_history_records(batch)
+
+
+def suite_history(args) -> None:
+    from pu import history
+    from pu.constants import SEARCH_INDEX_PATH
+    from pu.search import search_history
+
+    history.configure_history(_config())
+    for size in sorted(args.sizes):
+        label = f"{size // 1000}k" if size < 1_000_000 else f"{size // 1_000_000}m"
+        log(f"  (writing {size} history records)")
+        _fill_history(size)
+        measure(f"history.append.{label}", lambda: history.log_history("bench prompt", "ls", False, "low", []), repeat=args.repeat, number=20)
+        measure(f"history.tail20.{label}", lambda: history.tail_history(20), repeat=args.repeat)
+        measure(f"history.get_last.{label}", lambda: history.get_history_entry(-1), repeat=args.repeat)
+        measure(f"history.scan.{label}", lambda: sum(1 for _ in history.iter_history()), repeat=max(1, args.repeat // 2))
+        measure(
+            f"history.search_cold.{label}",
+            lambda: search_history("docker logs"),
+            repeat=max(1, args.repeat // 2),
+            setup=lambda: [p.unlink() for p in SEARCH_INDEX_PATH.parent.glob(SEARCH_INDEX_PATH.name + "*")],
+        )
+        measure(f"history.search_warm.{label}", lambda: search_history("dokcer logs since:7d"), repeat=args.repeat)
+
+
+def _make_tree(root: Path, files: int, fanout: int = 8, per_dir: int = 25) -> None:
+    # breadth-first directories of `per_dir` files each until `files` files exist
+    created = 0
+    queue = [root]
+    while created < files:
+        directory = queue.pop(0)
+        directory.mkdir(parents=True, exist_ok=True)
+        for i in range(min(per_dir, files - created)):
+            (directory / f"file_{i}.{'py' if i % 3 else 'txt'}").write_bytes(b"x" * (i * 37 % 4096))
+            created += 1
+        queue.extend(directory / f"dir_{j}" for j in range(fanout))
+    (root / ".gitignore").write_text("*.txt\nbuild/\n")
+
+
+def suite_context(args) -> None:
+    from pu.constants import CONTEXT_CACHE_PATH
+    from pu.context import build_file_context
+
+    for files in (1_000, 10_000):
+        root = WORKDIR / f"tree_{files}"
+        _make_tree(root, files)
+        label = f"{files // 1000}k"
+        drop_cache = lambda: CONTEXT_CACHE_PATH.unlink(missing_ok=True)  # noqa: E731
+        measure(f"context.walk_cold.{label}", lambda: build_file_context(root, 6), repeat=args.repeat, setup=drop_cache)
+        build_file_context(root, 6)
+        measure(f"context.walk_warm.{label}", lambda: build_file_context(root, 6), repeat=args.repeat)
+        measure(f"context.budget_2k.{label}", lambda: build_file_context(root, 6, token_budget=2000, prompt="python files"), repeat=args.repeat)
+
+
+def suite_provider(args, server) -> None:
+    from pu.breaker import configure_breaker
+    from pu.provider import generate_command
+
+    configure_breaker(_config())
+    server.settings.latency_ms = 0
+    measure("provider.request", lambda: generate_command("list files", "", "gpt-4o-mini", "sk-bench"), repeat=args.repeat, number=20)
+    measure(
+        "provider.stream",
+        lambda: generate_command("list files", "", "gpt-4o-mini", "sk-bench", on_line=lambda line: None),
+        repeat=args.repeat,
+        number=20,
+    )
+    server.settings.latency_ms = 50
+    measure("provider.request_50ms_upstream", lambda: generate_command("list files", "", "gpt-4o-mini", "sk-bench"), repeat=args.repeat, number=5)
+    server.settings.latency_ms = 0
+
+
+def suite_e2e(args, server) -> None:
+    home = WORKDIR / "e2e-home"
+    home.mkdir(exist_ok=True)
+    (home / ".puconfig").write_text("[openai]\napi_key = sk-bench\nmodel = gpt-4o-mini\n")
+    env = {**os.environ, "HOME": str(home), "OPENAI_BASE_URL": server.base_url, "PYTHONDONTWRITEBYTECODE": "1"}
+    pu = [sys.executable, str(ROOT / "pu.py")]
+
+    def run(argv: List[str]) -> None:
+        subprocess.run(argv, env=env, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+
+    measure("e2e.python_startup", lambda: run([sys.executable, "-c", "pass"]), repeat=args.repeat)
+    measure("e2e.import_cli", lambda: run([sys.executable, "-c", "import pu.cli"]), repeat=args.repeat)
+    measure("e2e.help", lambda: run(pu + ["--help"]), repeat=args.repeat)
+    measure("e2e.dry_run", lambda: run(pu + ["-p", "list files", "--dry-run", "--no-cache"]), repeat=args.repeat)
+    run(pu + ["-p", "list files", "--dry-run"])  # fills the response cache
+    measure("e2e.dry_run_cached", lambda: run(pu + ["-p", "list files", "--dry-run"]), repeat=args.repeat)
+    measure("e2e.history_tail", lambda: run(pu + ["history", "--last", "20"]), repeat=args.repeat)
+
+
+def compare(baseline: dict, current: dict, max_regression: float) -> List[str]:
+    regressions = []
+    for name, result in current.items():
+        old = baseline.get(name)
+        if not old:
+            continue
+        before, after = old["median_ms"], result["median_ms"]
+        if after > before * (1 + max_regression) and after - before > NOISE_FLOOR_MS:
+            regressions.append(f"{name}: {before:.3f} ms -> {after:.3f} ms (+{(after / before - 1) * 100:.0f}%)")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--suite", default=",".join(SUITES), help=f"Comma-separated suites (default all: {','.join(SUITES)})")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="History sizes in records (default 10000,100000)")
+    parser.add_argument("--repeat", type=int, default=5, help="Samples per benchmark (default 5)")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", help="Earlier JSON report to compare medians against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="Allowed slowdown vs. baseline as a fraction (default 0.2)")
+    parser.add_argument("--keep", action="store_true", help=f"Keep the scratch directory ({WORKDIR})")
+    args = parser.parse_args()
+    args.sizes = [int(s) for s in args.sizes.split(",") if s]
+    suites = [s.strip() for s in args.suite.split(",") if s.strip()]
+    unknown = set(suites) - set(SUITES)
+    if unknown:
+        parser.error(f"unknown suite(s): {', '.join(sorted(unknown))}")
+
+    server = start_server(FakeSettings(content="ls -la"))
+    os.environ["OPENAI_BASE_URL"] = server.base_url
+    started = time.time()
+    try:
+        for suite in suites:
+            log(f"[{suite}]")
+            if suite in ("provider", "e2e"):
+                globals()[f"suite_{suite}"](args, server)
+            else:
+                globals()[f"suite_{suite}"](args)
+    finally:
+        server.shutdown()
+        if not args.keep:
+            shutil.rmtree(WORKDIR, ignore_errors=True)
+
+    try:
+        revision = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        revision = ""
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "duration_s": round(time.time() - started, 1),
+            "revision": revision,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "suites": suites,
+            "sizes": args.sizes,
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n")
+    else:
+        print(text)
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text()).get("results", {})
+        regressions = compare(baseline, results, args.max_regression)
+        for line in regressions:
+            log(f"REGRESSION {line}")
+        if regressions:
+            return 1
+        log(f"no regressions beyond {args.max_regression:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,11 @@
 #!/usr/bin/env python3
+import sys
+
+if "--startup-profile" in sys.argv:
+    from pu.startup import start_import_profiler
+
+    start_import_profiler()
+
 from pu.cli import main
 
 if __name__ == "__main__":
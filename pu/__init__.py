@@ -1,13 +1,25 @@
 __all__ = [
+    "breaker",
+    "cache",
     "cli",
     "commands",
     "config",
     "constants",
+    "context",
+    "daemon",
     "dryrun",
+    "endpoints",
+    "execute",
     "history",
+    "history_db",
+    "prompts",
     "provider",
     "redaction",
+    "retrieval",
     "risk",
+    "search",
+    "shellparse",
+    "startup",
 ]
 
 __version__ = "0.1.0"
@@ -0,0 +1,82 @@
+import configparser
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Literal
+
+from .constants import PROVIDER_HEALTH_PATH
+
+DEFAULT_FAILURE_THRESHOLD = 1
+DEFAULT_COOLDOWN_SECONDS = 60
+
+_settings = {"enabled": True, "threshold": DEFAULT_FAILURE_THRESHOLD, "cooldown": DEFAULT_COOLDOWN_SECONDS}
+
+
+def configure_breaker(config: configparser.ConfigParser) -> None:
+    _settings["enabled"] = config.getboolean("openai", "breaker", fallback=True)
+    _settings["threshold"] = max(1, config.getint("openai", "breaker_threshold", fallback=DEFAULT_FAILURE_THRESHOLD))
+    _settings["cooldown"] = config.getint("openai", "breaker_cooldown", fallback=DEFAULT_COOLDOWN_SECONDS)
+
+
+class CircuitBreaker:
+    # closed: call normally; open: skip the provider until the cooldown elapses;
+    # half_open: cooldown elapsed, allow a single probe attempt whose outcome closes or re-opens it
+    def __init__(self, key: str = "openai", path: Path = PROVIDER_HEALTH_PATH):
+        self.key = key
+        self.path = path
+        self.threshold = _settings["threshold"]
+        self.cooldown = _settings["cooldown"]
+        self.enabled = _settings["enabled"]
+        self._health = self._load()
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self) -> None:
+        # pid and thread: pu batch workers and daemon threads may save at the same moment
+        tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            with open(tmp, "w") as f:
+                json.dump(self._health, f)
+            os.replace(tmp, self.path)
+        except OSError:
+            pass
+
+    @property
+    def _state(self) -> dict:
+        return self._health.get(self.key, {})
+
+    def state(self) -> Literal["closed", "open", "half_open"]:
+        if not self.enabled or self._state.get("state") != "open":
+            return "closed"
+        if time.time() - self._state.get("opened_at", 0) >= self.cooldown:
+            return "half_open"
+        return "open"
+
+    def retry_in(self) -> int:
+        return max(0, int(self._state.get("opened_at", 0) + self.cooldown - time.time()))
+
+    def last_error(self) -> str:
+        return self._state.get("last_error", "")
+
+    def record_success(self) -> None:
+        if self._state:
+            self._health.pop(self.key, None)
+            self._save()
+
+    def record_failure(self, error: str) -> None:
+        if not self.enabled:
+            return
+        failures = self._state.get("failures", 0) + 1
+        entry = {"state": "closed", "failures": failures, "last_error": error}
+        if failures >= self.threshold or self.state() == "half_open":
+            entry.update(state="open", opened_at=time.time())
+        self._health[self.key] = entry
+        self._save()
@@ -0,0 +1,95 @@
+import configparser
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict
+
+from .constants import CACHE_PATH
+
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 500
+
+
+def normalize_prompt(prompt: str) -> str:
+    return " ".join(prompt.lower().split())
+
+
+def cache_key(prompt: str, context: str, model: str) -> str:
+    # a new prompt version or a switch of [openai] explain changes the reply, so neither may hit old entries
+    from .endpoints import explain_enabled
+    from .prompts import PROMPT_VERSION
+
+    context_hash = hashlib.sha256(context.encode("utf-8")).hexdigest()
+    mode = "command_explained" if explain_enabled() else "command"
+    raw = "\0".join([normalize_prompt(prompt), context_hash, model, PROMPT_VERSION, mode])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, path: Path = CACHE_PATH, ttl: int = DEFAULT_TTL_SECONDS, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: Dict[str, dict] | None = None
+
+    @classmethod
+    def from_config(cls, config: configparser.ConfigParser) -> "ResponseCache | None":
+        if not config.getboolean("cache", "enabled", fallback=True):
+            return None
+        return cls(
+            ttl=config.getint("cache", "ttl", fallback=DEFAULT_TTL_SECONDS),
+            max_entries=config.getint("cache", "max_entries", fallback=DEFAULT_MAX_ENTRIES),
+        )
+
+    def _load(self) -> Dict[str, dict]:
+        if self._entries is None:
+            try:
+                with open(self.path, "r") as f:
+                    data = json.load(f)
+                self._entries = data if isinstance(data, dict) else {}
+            except (OSError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def _save(self) -> None:
+        # pid and thread: pu batch workers may save at the same moment
+        tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump(self._entries, f)
+        os.replace(tmp, self.path)
+
+    def _expired(self, entry: dict, now: float) -> bool:
+        return now - entry.get("ts", 0) > self.ttl
+
+    def get(self, prompt: str, context: str, model: str) -> str | None:
+        entry = self._load().get(cache_key(prompt, context, model))
+        if not entry or self._expired(entry, time.time()):
+            return None
+        return entry.get("command")
+
+    def explanation(self, prompt: str, context: str, model: str) -> str | None:
+        entry = self._load().get(cache_key(prompt, context, model))
+        if not entry or self._expired(entry, time.time()):
+            return None
+        return entry.get("explanation")
+
+    def put(self, prompt: str, context: str, model: str, command: str, explanation: str | None = None) -> None:
+        entries = self._load()
+        now = time.time()
+        for key in [k for k, e in entries.items() if self._expired(e, now)]:
+            del entries[key]
+        entries[cache_key(prompt, context, model)] = {"command": command, "ts": now}
+        if explanation:
+            entries[cache_key(prompt, context, model)]["explanation"] = explanation
+        if len(entries) > self.max_entries:
+            oldest = sorted(entries, key=lambda k: entries[k].get("ts", 0))
+            for key in oldest[: len(entries) - self.max_entries]:
+                del entries[key]
+        try:
+            self._save()
+        except OSError:
+            pass
@@ -1,92 +1,202 @@
 import argparse
 from typing import List, Literal
 
-from .config import load_config
-from .provider import generate_command_with_retries
-from .commands import execute_command_flow
-from .history import read_history_jsonl
-from .redaction import redact_text
+# Only argparse is imported eagerly; provider SDK, subprocess and the regex-based
+# modules are imported on the code paths that use them to keep cold start cheap.
 
 
-def run_pu(prompt: str, depth: int | None, dry_run: bool, config, profile: Literal["safe", "standard", "power"] = "standard", context_ignore: List[str] | None = None, context_max_entries: int | None = None):
-    # context gathering simplified (moved from monolith for brevity); could import from a context module
+def run_pu(prompt: str, depth: int | None, dry_run: bool, config, profile: Literal["safe", "standard", "power"] = "standard", context_ignore: List[str] | None = None, context_max_entries: int | None = None, use_cache: bool = True, stream: bool = False, context_tokens: int | None = None, timings=None):
+    from .timing import Timings
+
+    timings = timings if timings is not None else Timings()
+    from .templates import TemplateError, expand_macro
+
+    # macros from [templates] never reach the model, the cache or the file context
+    with timings.span("template"):
+        try:
+            macro = expand_macro(prompt, config)
+        except TemplateError as e:
+            print(f"❌ {e}")
+            return
+    if macro is not None:
+        from .commands import execute_command_flow
+
+        print(f"⚡ Macro :{macro[0]}")
+        execute_command_flow(macro[1], dry_run, prompt, "template", timings=timings)
+        return
     context = ""
     if depth:
         from pathlib import Path
-        import fnmatch
+        from .context import build_file_context
 
-        def get_file_tree(path: Path, depth: int, current_level: int = 0, remain: List[int] | None = None) -> str:
-            if current_level >= depth:
-                return ""
-            entries = []
-            try:
-                children = sorted(path.iterdir())
-                for entry in children:
-                    if context_ignore and any(fnmatch.fnmatch(entry.name, pat) for pat in context_ignore):
-                        continue
-                    entries.append("  " * current_level + f"- {entry.name}")
-                    if context_max_entries is not None:
-                        if remain is None:
-                            remain = [context_max_entries]
-                        remain[0] -= 1
-                        if remain[0] <= 0:
-                            break
-                    if entry.is_dir():
-                        sub = get_file_tree(entry, depth, current_level + 1, remain)
-                        if sub:
-                            entries.append(sub)
-            except PermissionError:
-                entries.append("  " * current_level + "- [Permission Denied]")
-            return "\n".join(e for e in entries if e)
-
-        context = f"\n\nHere is the file list (depth={depth}):\n{get_file_tree(Path.cwd(), depth, 0, [context_max_entries or 10_000])}\n"
+        use_gitignore = config.getboolean("context", "gitignore", fallback=True)
+        budget = context_tokens or config.getint("context", "token_budget", fallback=0)
+        with timings.span("context"):
+            tree, tokens = build_file_context(Path.cwd(), depth, context_ignore, context_max_entries, use_gitignore, budget, prompt)
+        context = f"\n\nHere is the file list (depth={depth}):\n{tree}\n"
+        print(f"📎 File context: ~{tokens} tokens" + (f" (budget {budget})" if budget else ""))
+
+    from .cache import ResponseCache
+    from .commands import StreamPrinter, execute_command_flow
+    from .provider import generate_command
+    from .prompts import history_snippets
+    from .retrieval import local_answer, similar_examples
 
     model = config["openai"].get("model", "gpt-4o-mini")
     api_key = config["openai"]["api_key"]
-    command, provider = generate_command_with_retries(prompt, context, model, api_key)
-    execute_command_flow(command, dry_run, prompt, provider)
+    with timings.span("cache"):
+        cache = ResponseCache.from_config(config) if use_cache else None
+        command = cache.get(prompt, context, model) if cache else None
+    printer = None
+    with timings.span("local"):
+        local = local_answer(prompt) if command is None else None
+    if command is not None:
+        provider = "cache"
+        explanation = cache.explanation(prompt, context, model)
+    elif local is not None:
+        command, provider, explanation = local[0], "local", None
+        print(f"📚 Answered from history: the command run for \"{local[2]}\" (similarity {local[1]:.2f})")
+    else:
+        # similar past commands go after the file list; the response cache stays keyed on both without them
+        with timings.span("local"):
+            examples = history_snippets(similar_examples(prompt))
+        printer = StreamPrinter() if stream else None
+        command, provider, explanation = generate_command(
+            prompt, context + (f"\n\n{examples}\n" if examples else ""), model, api_key, on_line=printer, timings=timings
+        )
+        if cache and provider == "openai":
+            cache.put(prompt, context, model, command, explanation)
+    shown = printer is not None and printer.shown and provider == "openai"
+    execute_command_flow(command, dry_run, prompt, provider, shown=shown, timings=timings, explanation=explanation)
+
+
+def _positive_int(value: str) -> int:
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid int value: {value!r}")
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
 
 
 def main():
-    parser = argparse.ArgumentParser(description="pu: natural language CLI assistant")
+    # accepted both before and after the subcommand name
+    profiling = argparse.ArgumentParser(add_help=False)
+    profiling.add_argument("--startup-profile", action="store_true", default=argparse.SUPPRESS, help="Report per-module import cost after the command finishes")
+
+    parser = argparse.ArgumentParser(description="pu: natural language CLI assistant", parents=[profiling])
     subparsers = parser.add_subparsers(dest="subcmd")
 
     parser.add_argument("-p", "--prompt", help="Prompt describing the task")
     parser.add_argument("--with-files", type=int, help="Include file list with given depth")
     parser.add_argument("--context-ignore", action="append", help="Glob to ignore in file context (can repeat)")
     parser.add_argument("--context-max", type=int, help="Max entries to include in file context")
+    parser.add_argument("--context-tokens", type=int, help="Token budget for a compressed file context (summaries, folding, prompt-relevant entries first)")
     parser.add_argument("--dry-run", action="store_true", help="Only print the command, do not execute")
     parser.add_argument("--model", help="Override model name for this run")
+    parser.add_argument("--stream", action="store_true", help="Print the command line by line as the model generates it")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the local response cache for this run")
     parser.add_argument("--profile", choices=["safe", "standard", "power"], default="standard", help="Safety profile")
 
-    p_hist = subparsers.add_parser("history", help="View or replay command history")
+    p_hist = subparsers.add_parser("history", help="View or replay command history", parents=[profiling])
     p_hist.add_argument("--last", type=int, default=20, help="Show last N entries (default 20)")
-    p_hist.add_argument("--grep", help="Filter entries containing substring")
+    p_hist.add_argument(
+        "--search",
+        "--grep",
+        dest="search",
+        metavar="QUERY",
+        help="Ranked, typo-tolerant search; filters: cwd: risk: provider: executed: since: until:",
+    )
     p_hist.add_argument("--replay", help="Replay entry by index from the listed set")
+    p_hist.add_argument("--audit", action="store_true", help="Re-score the listed entries and show only risky ones (use --last 0 for all)")
+    p_hist.add_argument("--rotate", action="store_true", help="Archive the live history file now")
+    p_hist.add_argument("--failed", action="store_true", help="Only commands that ran and exited non-zero")
+    p_hist.add_argument("--slow", type=float, metavar="SECONDS", help="Only commands that ran for at least this long")
+    p_hist.add_argument("--output", action="store_true", help="Also print the captured (redacted) output tail")
+
+    p_serve = subparsers.add_parser("serve", help="Run a resident daemon that keeps the provider client warm", parents=[profiling])
+    p_serve.add_argument("--socket", help="Unix socket path (default ~/.pu.sock)")
+
+    p_batch = subparsers.add_parser("batch", help="Generate commands for many prompts concurrently (JSONL output)", parents=[profiling])
+    p_batch.add_argument("file", nargs="?", help="File with one prompt per line or JSONL items (default stdin)")
+    p_batch.add_argument("--concurrency", type=int, help="Maximum parallel provider requests (default 4)")
+    p_batch.add_argument("--no-cache", action="store_true", help="Bypass the local response cache")
+
+    p_stats = subparsers.add_parser("stats", help="Latency percentiles per phase, model and provider", parents=[profiling])
+    p_stats.add_argument("--since", default="30d", help="Window start: date, today/yesterday or age like 7d (default 30d)")
+    p_stats.add_argument("--until", help="Window end (default now)")
+    p_stats.add_argument("--json", action="store_true", help="Print the report as JSON")
 
-    p_doc = subparsers.add_parser("doctor", help="Validate configuration and environment")
+    p_doc = subparsers.add_parser("doctor", help="Validate configuration and environment", parents=[profiling])
+    p_doc.add_argument("--latency", type=_positive_int, metavar="N", help="Send N probe requests and report connect, first-token and total latency percentiles")
+    p_doc.add_argument("--timeout", type=float, default=10.0, help="Seconds to wait for each model request (default 10)")
 
-    p_why = subparsers.add_parser("why", help="Explain how the last command satisfies its prompt")
+    p_why = subparsers.add_parser("why", help="Explain how the last command satisfies its prompt", parents=[profiling])
     p_why.add_argument("--index", help="Explain a specific history index (default last)")
 
-    p_edit = subparsers.add_parser("edit", help="Modify the last or specified command with an instruction")
+    p_edit = subparsers.add_parser("edit", help="Modify the last or specified command with an instruction", parents=[profiling])
     p_edit.add_argument("--index", help="Edit a specific history index (default last)")
     p_edit.add_argument("--instruction", required=True, help="Instruction describing how to modify the command")
     p_edit.add_argument("--dry-run", action="store_true", help="Preview edited command without running")
 
     args = parser.parse_args()
 
+    if not getattr(args, "startup_profile", False):
+        _dispatch(args, parser)
+        return
+    from .startup import print_import_report, start_import_profiler
+
+    start_import_profiler()
+    try:
+        _dispatch(args, parser)
+    finally:
+        print_import_report()
+
+
+def _dispatch(args, parser):
+    from .breaker import configure_breaker
     from .config import load_config
-    config = load_config()
+    from .endpoints import configure_endpoints
+    from .execute import configure_execution
+    from .history import configure_history
+    from .timing import Timings
+
+    timings = Timings()
+    with timings.span("config"):
+        config = load_config()
+        configure_history(config)
+        configure_breaker(config)
+        configure_endpoints(config)
+        configure_execution(config)
+        # [risk] and [retrieval] are read by those modules on first use
 
     if args.subcmd == "history":
-        from .history import read_history_jsonl
+        from .history import rotate_history_if_needed, tail_history
+
+        if args.rotate:
+            for archive in rotate_history_if_needed(force=True):
+                print(f"📦 Archived to {archive}")
+            return
+        if args.search:
+            from .search import search_history
+
+            entries = search_history(args.search, args.last or None)
+            if args.failed or args.slow is not None:
+                from .history import matches_execution
+
+                entries = [e for e in entries if matches_execution(e, args.failed, args.slow)]
+        else:
+            entries = tail_history(args.last, failed=args.failed, slow_seconds=args.slow)
+        if args.audit:
+            from .risk import score_many
 
-        entries = read_history_jsonl()
-        if args.grep:
-            q = args.grep.lower()
-            entries = [e for e in entries if q in (e.get("prompt", "") + "\n" + e.get("command", "")).lower()]
-        entries = entries[-args.last:] if args.last else entries
+            scores = score_many(e.get("command_raw") or e.get("command") or "" for e in entries)
+            flagged = [(i, e, s) for i, (e, s) in enumerate(zip(entries, scores)) if s[0] != "low"]
+            for i, e, (risk, reasons) in flagged:
+                print(f"[{i}] {e.get('ts')} :: {risk} :: {e.get('command')}\n    ↳ " + "; ".join(reasons))
+            print(f"{len(flagged)} of {len(entries)} entries flagged")
+            return
         if args.replay is not None:
             try:
                 index = int(args.replay)
@@ -96,21 +206,50 @@ def main():
             if index < 0 or index >= len(entries):
                 print("❌ Replay index out of range")
                 return
+            from .redaction import redact_text
+
             entry = entries[index]
             original = entry.get("command_raw") or entry.get("command")
             print(f"About to replay command from {entry.get('ts')}:\n{redact_text(original)}\n")
             confirm = input("Re-run this command? [y/N] ").strip().lower()
             if confirm == "y":
-                try:
-                    import os, subprocess
+                from .execute import describe_failure, run_command
 
-                    subprocess.run(original, shell=True, check=True, cwd=entry.get("cwd") or os.getcwd())
+                result = run_command(original, cwd=entry.get("cwd"))
+                if result.ok:
                     print("✅ Replayed successfully")
-                except subprocess.CalledProcessError as e:
-                    print(f"❌ Command failed: {e}")
+                else:
+                    print(f"❌ Command failed: {describe_failure(result)}")
             return
         for i, e in enumerate(entries):
-            print(f"[{i}] {e.get('ts')} :: {e.get('risk','')} :: {e.get('command')}")
+            status = ""
+            if e.get("exit_code") is not None:
+                status = f" :: exit {e['exit_code']} in {e.get('wall_ms', 0) / 1000:.2f}s"
+            print(f"[{i}] {e.get('ts')} :: {e.get('risk','')}{status} :: {e.get('command')}")
+            if args.output and e.get("output"):
+                print("    " + e["output"].rstrip("\n").replace("\n", "\n    "))
+        return
+
+    if args.subcmd == "serve":
+        from pathlib import Path
+        from .daemon import serve
+
+        if args.socket:
+            serve(config, Path(args.socket).expanduser())
+        else:
+            serve(config)
+        return
+
+    if args.subcmd == "batch":
+        from .cli_batch import handle_batch
+
+        handle_batch(args, config)
+        return
+
+    if args.subcmd == "stats":
+        from .cli_stats import handle_stats
+
+        handle_stats(args, config)
         return
 
     if args.subcmd == "doctor":
@@ -145,6 +284,10 @@ def main():
         profile=args.profile,
         context_ignore=args.context_ignore,
         context_max_entries=args.context_max,
+        context_tokens=args.context_tokens,
+        use_cache=not args.no_cache,
+        stream=args.stream or config.getboolean("openai", "stream", fallback=False),
+        timings=timings,
     )
 
 
@@ -0,0 +1,102 @@
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from .cache import ResponseCache
+from .history import HistoryWriter, build_history_record
+from .provider import generate_command
+from .risk import analyze_command_risk
+from .timing import Timings
+
+DEFAULT_CONCURRENCY = 4
+
+
+def _read_items(path: str | None) -> List[dict]:
+    stream = sys.stdin if not path or path == "-" else open(path, "r")
+    items: List[dict] = []
+    try:
+        for line in stream:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("{"):
+                try:
+                    item = json.loads(line)
+                except ValueError:
+                    item = None
+                if isinstance(item, dict) and item.get("prompt"):
+                    items.append(item)
+                    continue
+            items.append({"prompt": line})
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+    return items
+
+
+def handle_batch(args, config):
+    try:
+        items = _read_items(args.file)
+    except OSError as e:
+        print(f"❌ Cannot read batch input: {e}", file=sys.stderr)
+        sys.exit(1)
+    if not items:
+        print("No prompts to process.", file=sys.stderr)
+        return
+    default_model = config["openai"].get("model", "gpt-4o-mini")
+    api_key = config["openai"]["api_key"]
+    concurrency = max(1, args.concurrency or config.getint("batch", "concurrency", fallback=DEFAULT_CONCURRENCY))
+    cache = ResponseCache.from_config(config) if not args.no_cache else None
+
+    results: List[dict | None] = [None] * len(items)
+    pending: List[int] = []
+    for i, item in enumerate(items):
+        model = item.get("model") or default_model
+        cached = cache.get(item["prompt"], item.get("context", ""), model) if cache else None
+        if cached is not None:
+            explanation = cache.explanation(item["prompt"], item.get("context", ""), model)
+            results[i] = {"command": cached, "provider": "cache", "metrics": {"explanation": explanation} if explanation else None}
+        else:
+            pending.append(i)
+
+    def work(i: int) -> dict:
+        item = items[i]
+        timings = Timings()
+        # warnings go to stderr so stdout stays valid JSONL
+        command, provider, explanation = generate_command(
+            item["prompt"], item.get("context", ""), item.get("model") or default_model, api_key, timings=timings, out=sys.stderr
+        )
+        metrics = timings.as_dict()
+        if explanation:
+            metrics["explanation"] = explanation
+        return {"command": command, "provider": provider, "metrics": metrics}
+
+    out = sys.stdout
+    # history is committed in groups as results arrive
+    with HistoryWriter() as writer, ThreadPoolExecutor(max_workers=concurrency) as pool:
+        generated = pool.map(work, pending)
+        for i, item in enumerate(items):
+            if results[i] is None:
+                results[i] = next(generated)
+                if cache and results[i]["provider"] == "openai":
+                    cache.put(
+                        item["prompt"], item.get("context", ""), item.get("model") or default_model, results[i]["command"], results[i]["metrics"].get("explanation")
+                    )
+            result = results[i]
+            risk, reasons = analyze_command_risk(result["command"])
+            writer.append(build_history_record(item["prompt"], result["command"], False, risk, reasons, result["provider"], result["metrics"]))
+            out.write(
+                json.dumps(
+                    {
+                        "index": i,
+                        "prompt": item["prompt"],
+                        "command": result["command"],
+                        "provider": result["provider"],
+                        "risk": risk,
+                        "reasons": reasons,
+                    }
+                )
+                + "\n"
+            )
+            out.flush()
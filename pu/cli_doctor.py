@@ -1,12 +1,181 @@
-from typing import List
+import os
+import socket
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
 
-from .provider import generate_command_with_retries
+DEFAULT_TIMEOUT = 10.0
+# local checks should finish at once; one that takes longer is itself the finding
+LOCAL_TIMEOUT = 5.0
+TOOLS = ["git", "docker", "tar"]
+
+# a check returns (ok, message); ok None means informational (nothing to fix)
+CheckResult = Tuple[bool | None, str]
+
+
+class _Check:
+    # runs on its own daemon thread, so a check stuck in DNS, a hung daemon socket or a provider
+    # that never answers is reported as timed out without holding up the others or pu's exit
+    def __init__(self, label: str, func: Callable[[], CheckResult], timeout: float):
+        self.label = label
+        self.func = func
+        self.timeout = timeout
+        self.result: CheckResult | None = None
+        self._done = threading.Event()
+
+    def start(self) -> None:
+        self.started = time.perf_counter()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self) -> None:
+        try:
+            self.result = self.func()
+        except Exception as e:
+            self.result = (False, f"failed: {_describe_error(e)}")
+        finally:
+            self._done.set()
+
+    def wait(self) -> CheckResult:
+        if not self._done.wait(max(0.0, self.started + self.timeout - time.perf_counter())):
+            return (False, f"timed out after {self.timeout:.0f}s")
+        return self.result
+
+
+def _describe_error(error: Exception) -> str:
+    # class name plus HTTP status, which is what the latency error breakdown groups by
+    status = getattr(error, "status_code", None)
+    return f"{type(error).__name__} ({status})" if status else type(error).__name__
+
+
+def _probe(endpoint, timeout: float) -> Dict[str, float]:
+    # one streamed request without retries or breaker bookkeeping; connect is DNS + TCP to the API host
+    # measured on a separate socket, first_token and total are for the request itself, all in ms
+    from urllib.parse import urlsplit
+
+    from .prompts import build_messages
+    from .provider import get_client
+
+    client = get_client(endpoint.api_key, endpoint.base_url)
+    url = urlsplit(str(client.base_url))
+    start = time.perf_counter()
+    socket.create_connection((url.hostname, url.port or (443 if url.scheme == "https" else 80)), timeout=timeout).close()
+    connect = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    stream = client.with_options(timeout=timeout).chat.completions.create(
+        model=endpoint.model, messages=build_messages("command", "list files"), stream=True
+    )
+    first_token = None
+    for chunk in stream:
+        if first_token is None and chunk.choices and chunk.choices[0].delta.content:
+            first_token = (time.perf_counter() - start) * 1000
+    total = (time.perf_counter() - start) * 1000
+    return {"connect": connect, "first_token": total if first_token is None else first_token, "total": total}
+
+
+def _check_model(endpoint, timeout: float) -> CheckResult:
+    try:
+        probe = _probe(endpoint, timeout)
+    except Exception as e:
+        return (False, f"failed: {_describe_error(e)}: {e}")
+    return (True, f"OK in {probe['total']:.0f} ms (connect {probe['connect']:.0f} ms, first token {probe['first_token']:.0f} ms)")
+
+
+def _check_daemon() -> CheckResult:
+    from .daemon import request_daemon
+
+    status = request_daemon({"op": "ping"})
+    if status:
+        return (None, f"running (pid {status['pid']})")
+    return (None, "not running (optional, start with `pu serve`)")
+
+
+def _size(paths: List[Path]) -> int:
+    return sum(p.stat().st_size for p in paths if p.exists())
+
+
+def _check_history() -> CheckResult:
+    # file sizes and the time a full read takes, i.e. what pu history, stats and search pay at worst
+    from .constants import HISTORY_DB_PATH, HISTORY_JSONL_PATH, HISTORY_PATH
+    from .history import _settings as history_settings
+    from .history import history_archives, iter_recent_history
+
+    backend = history_settings["backend"]
+    archives = history_archives()
+    if backend == "sqlite":
+        files = f"{_mb(_size([HISTORY_DB_PATH]))} database"
+    else:
+        files = f"{_mb(_size([HISTORY_JSONL_PATH]))} live + {len(archives)} archives ({_mb(_size(archives))})"
+    if HISTORY_PATH.exists():
+        files += f", {_mb(_size([HISTORY_PATH]))} text log"
+    start = time.perf_counter()
+    records = sum(1 for _ in iter_recent_history())
+    parse_ms = (time.perf_counter() - start) * 1000
+    return (None, f"{backend}, {files}; {records} records read in {parse_ms:.0f} ms")
+
+
+def _mb(size: int) -> str:
+    return f"{size / (1024 * 1024):.1f} MB"
+
+
+def _check_startup(timeout: float) -> CheckResult:
+    # measured in a fresh interpreter: this process has already imported most of it
+    import subprocess
+
+    code = (
+        "import time; s = time.perf_counter(); import pu.cli; c = time.perf_counter()\n"
+        "try:\n    import openai\nexcept ImportError:\n    print((c - s) * 1000, -1)\n"
+        "else:\n    print((c - s) * 1000, (time.perf_counter() - c) * 1000)"
+    )
+    root = str(Path(__file__).resolve().parent.parent)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [root, os.environ.get("PYTHONPATH")])))
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, timeout=timeout, env=env)
+    if out.returncode != 0:
+        return (False, f"import failed: {out.stderr.strip().splitlines()[-1] if out.stderr.strip() else out.returncode}")
+    cli_ms, sdk_ms = (float(v) for v in out.stdout.split())
+    if sdk_ms < 0:
+        return (False, f"pu.cli imports in {cli_ms:.0f} ms; openai SDK not installed")
+    return (None, f"pu.cli imports in {cli_ms:.0f} ms, openai SDK in {sdk_ms:.0f} ms (a running `pu serve` keeps it loaded)")
+
+
+def _check_tool(tool: str) -> CheckResult:
+    from shutil import which
+
+    return (None, "found" if which(tool) else "not found (optional)")
+
+
+def _latency_report(endpoints: list, count: int, timeout: float) -> None:
+    # sequential probes, so each one measures the endpoint rather than queueing behind the others
+    from .cli_stats import PERCENTILES, percentile
+
+    for endpoint in endpoints:
+        print(f"\nProbing {endpoint.name} ({endpoint.model} at {endpoint.base_url or 'SDK default'}) with {count} requests...")
+        samples: Dict[str, List[float]] = {"connect": [], "first_token": [], "total": []}
+        errors: Dict[str, int] = {}
+        for _ in range(count):
+            try:
+                probe = _probe(endpoint, timeout)
+            except Exception as e:
+                key = _describe_error(e)
+                errors[key] = errors.get(key, 0) + 1
+                continue
+            for name, ms in probe.items():
+                samples[name].append(ms)
+        ok = len(samples["total"])
+        print(f"{ok}/{count} succeeded")
+        if ok:
+            print(f"{'':<12}" + "".join(f" {f'p{p} ms':>9}" for p in PERCENTILES))
+            for name, values in samples.items():
+                values.sort()
+                print(f"{name:<12}" + "".join(f" {percentile(values, p):>9.1f}" for p in PERCENTILES))
+        for key, n in sorted(errors.items(), key=lambda item: -item[1]):
+            print(f"  {n} × {key}")
 
 
 def handle_doctor(args, config):
     print("pu doctor — environment check")
     problems: List[str] = []
-    import sys
     pyver = sys.version.split()[0]
     print(f"Python: {pyver}")
     api_key = None
@@ -20,17 +189,38 @@ def handle_doctor(args, config):
     else:
         print("OpenAI API key: present (redacted)")
     print(f"Model: {model or 'not set'}")
-    try:
-        cmd, provider = generate_command_with_retries("list files", "", model or "gpt-4o-mini", api_key or "")
-        print(f"Model check: OK via {provider}")
-    except Exception as e:
-        problems.append(f"Model check failed: {e}")
-    for tool in ["git", "docker", "tar"]:
-        from shutil import which
-        if which(tool):
-            print(f"{tool}: found")
-        else:
-            print(f"{tool}: not found (optional)")
+    from .endpoints import hedge_after_ms, hedge_endpoint, primary_endpoint
+
+    primary = primary_endpoint(model or "gpt-4o-mini", api_key or "")
+    print(f"Endpoint: {primary.base_url or 'SDK default'}")
+    alternate = hedge_endpoint(primary)
+    if alternate is not None:
+        print(f"Hedge: {alternate.model} at {alternate.base_url or 'SDK default'} after {hedge_after_ms(primary):.0f} ms")
+    from .breaker import CircuitBreaker
+
+    breaker = CircuitBreaker()
+    if breaker.state() != "closed":
+        print(f"Provider circuit: {breaker.state().replace('_', '-')} (probe in {breaker.retry_in()}s). Last error: {breaker.last_error()}")
+
+    timeout = args.timeout
+    if args.latency:
+        _latency_report([e for e in (primary, alternate) if e is not None], args.latency, timeout)
+        return
+
+    checks = [
+        # the request has its own timeout; the extra allowance covers importing the SDK on this thread
+        _Check("Model check", lambda: _check_model(primary, timeout), timeout + LOCAL_TIMEOUT),
+        _Check("Daemon", _check_daemon, LOCAL_TIMEOUT),
+        _Check("History", _check_history, LOCAL_TIMEOUT),
+        _Check("Startup", lambda: _check_startup(DEFAULT_TIMEOUT), DEFAULT_TIMEOUT + 1),
+    ] + [_Check(tool, lambda tool=tool: _check_tool(tool), LOCAL_TIMEOUT) for tool in TOOLS]
+    for check in checks:
+        check.start()
+    for check in checks:
+        ok, message = check.wait()
+        print(f"{check.label}: {message}")
+        if ok is False:
+            problems.append(f"{check.label}: {message}")
     if problems:
         print("\n❌ Issues detected:")
         for p in problems:
@@ -38,5 +228,3 @@ def handle_doctor(args, config):
         print("\nTips: set OPENAI_API_KEY, edit ~/.puconfig, or run in --dry-run.")
     else:
         print("\n✅ All checks passed")
-
-
@@ -1,29 +1,29 @@
-import subprocess
 import os
-from .history import read_history_jsonl, log_history
-from .provider import generate_command_with_retries
+from .history import get_history_entry, log_history
+from .provider import generate_command
 from .risk import analyze_command_risk
 from .dryrun import build_dry_run_preview, review_multiline_command
+from .execute import describe_failure, run_command
+from .shellparse import parse_command
 from .redaction import redact_text
+from .timing import Timings
 
 
 def handle_edit(args, config):
-    entries = read_history_jsonl()
-    if not entries:
-        print("No history available to edit.")
-        return
-    entry = entries[-1]
+    index = -1
     if args.index is not None:
         try:
-            idx = int(args.index)
-            if 0 <= idx < len(entries):
-                entry = entries[idx]
-            else:
-                print("Index out of range.")
-                return
+            index = int(args.index)
         except ValueError:
             print("Index must be an integer.")
             return
+        if index < 0:
+            print("Index out of range.")
+            return
+    entry = get_history_entry(index)
+    if entry is None:
+        print("Index out of range." if args.index is not None else "No history available to edit.")
+        return
     base_cmd = entry.get("command_raw") or entry.get("command")
     instruction = args.instruction
     if not instruction:
@@ -31,35 +31,35 @@ def handle_edit(args, config):
         return
     model = config["openai"].get("model", "gpt-4o-mini")
     api_key = config["openai"]["api_key"]
-    modified_prompt = (
-        "Modify the following shell command according to the instruction. "
-        "Output only the raw modified shell command, no explanations.\n\n"
-        f"Command:\n{base_cmd}\n\nInstruction:\n{instruction}\n"
-    )
-    new_cmd, provider = generate_command_with_retries(modified_prompt, "", model, api_key)
+    timings = Timings()
+    new_cmd, provider, _ = generate_command(instruction, f"Command to modify:\n{base_cmd}", model, api_key, timings=timings, task="edit")
     print(f"\n📝 Edited command:\n{redact_text(new_cmd)}\n")
     executed = False
-    risk, reasons = analyze_command_risk(new_cmd)
+    result = None
+    parsed = parse_command(new_cmd)
+    risk, reasons = analyze_command_risk(parsed)
     if args.dry_run:
         print("💡 Dry run mode: command not executed.")
         if risk != "low":
             print(f"⚠️ Risk: {risk.upper()} — " + "; ".join(reasons))
-        for hint in build_dry_run_preview(new_cmd):
+        for hint in build_dry_run_preview(parsed):
             print("👉 " + hint)
     else:
         confirm = input("Run this edited command? [y/N] ").strip().lower()
         if confirm == "y":
-            lines_to_run = review_multiline_command(new_cmd)
+            lines_to_run = review_multiline_command(parsed)
             if not lines_to_run:
                 print("❌ Nothing approved to run.")
             else:
-                try:
-                    subprocess.run("\n".join(lines_to_run), shell=True, check=True, cwd=os.getcwd())
-                    executed = True
-                except subprocess.CalledProcessError as e:
-                    print(f"❌ Command failed: {e}")
+                result = run_command("\n".join(lines_to_run), cwd=os.getcwd())
+                executed = result.ok
+                if not result.ok:
+                    print(f"❌ Command failed: {describe_failure(result)}")
         else:
             print("❌ Cancelled.")
-    log_history(f"EDIT: {instruction}", new_cmd, executed, risk, reasons, provider)
+    metrics = timings.as_dict()
+    if result is not None:
+        metrics.update(result.as_dict())
+    log_history(f"EDIT: {instruction}", new_cmd, executed, risk, reasons, provider, metrics)
 
 
@@ -0,0 +1,109 @@
+import json
+import math
+from typing import Dict, List
+
+from .history import iter_recent_history
+from .search import parse_time_bound
+from .timing import PHASES
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(values: List[float], p: float) -> float:
+    # nearest-rank on sorted values
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def _summary(values: List[float]) -> dict:
+    values = sorted(values)
+    return {"n": len(values), **{f"p{p}": round(percentile(values, p), 1) for p in PERCENTILES}}
+
+
+def collect_stats(since: str | None, until: str | None) -> dict:
+    phases: Dict[str, List[float]] = {}
+    by_model: Dict[str, Dict[str, List[float]]] = {}
+    by_provider: Dict[str, Dict[str, List[float]]] = {}
+    tokens: Dict[str, List[int]] = {}
+    # per model: [cached, prompt] token sums over requests whose usage reported cached_tokens
+    cached: Dict[str, List[int]] = {}
+    retries = runs = hedged = 0
+    for record in iter_recent_history():
+        ts = record.get("ts") or ""
+        if until and ts >= until:
+            continue
+        if since and ts < since:
+            break
+        timings = record.get("timings_ms")
+        if not isinstance(timings, dict):
+            continue
+        runs += 1
+        retries += record.get("retries") or 0
+        hedged += bool(record.get("hedged"))
+        for phase, ms in timings.items():
+            phases.setdefault(phase, []).append(ms)
+        model = record.get("model") or "-"
+        for groups, key in ((by_model, model), (by_provider, record.get("provider") or "-")):
+            group = groups.setdefault(key, {})
+            for phase in ("total", "provider"):
+                if phase in timings:
+                    group.setdefault(phase, []).append(timings[phase])
+        usage = record.get("usage") or {}
+        if usage.get("total_tokens"):
+            tokens.setdefault(model, []).append(usage["total_tokens"])
+        if usage.get("prompt_tokens") and "cached_tokens" in usage:
+            sums = cached.setdefault(model, [0, 0])
+            sums[0] += usage["cached_tokens"]
+            sums[1] += usage["prompt_tokens"]
+
+    order = {name: i for i, name in enumerate(PHASES)}
+    return {
+        "runs": runs,
+        "retries": retries,
+        "hedged": hedged,
+        "phases": {name: _summary(phases[name]) for name in sorted(phases, key=lambda n: (order.get(n, len(order)), n))},
+        "models": {
+            name: {
+                **{phase: _summary(v) for phase, v in group.items()},
+                "avg_tokens": round(sum(tokens[name]) / len(tokens[name])) if tokens.get(name) else None,
+                "prompt_cached_pct": round(100 * cached[name][0] / cached[name][1], 1) if name in cached else None,
+            }
+            for name, group in sorted(by_model.items())
+        },
+        "providers": {name: {phase: _summary(v) for phase, v in group.items()} for name, group in sorted(by_provider.items())},
+    }
+
+
+def _row(label: str, summary: dict | None) -> str:
+    if not summary:
+        return f"{label:<22} {'-':>5}" + "".join(f" {'-':>9}" for _ in PERCENTILES)
+    return f"{label:<22} {summary['n']:>5}" + "".join(f" {summary[f'p{p}']:>9.1f}" for p in PERCENTILES)
+
+
+def handle_stats(args, config):
+    since = parse_time_bound(args.since) if args.since else None
+    until = parse_time_bound(args.until, end=True) if args.until else None
+    if (args.since and since is None) or (args.until and until is None):
+        print("❌ --since/--until expect a date (YYYY-MM-DD), today, yesterday or an age like 7d")
+        return
+    stats = collect_stats(since, until)
+    if args.json:
+        print(json.dumps(stats, indent=2))
+        return
+    if not stats["runs"]:
+        print("No timed runs in this window.")
+        return
+    window = f"since {args.since}" + (f" until {args.until}" if args.until else "")
+    print(f"📊 {stats['runs']} runs {window}, {stats['retries']} retries, {stats['hedged']} hedged\n")
+    header = f"{'':<22} {'n':>5}" + "".join(f" {f'p{p} ms':>9}" for p in PERCENTILES)
+    print("Phase" + header[5:])
+    for name, summary in stats["phases"].items():
+        print(_row(name, summary))
+    for title, groups in (("Model", stats["models"]), ("Provider", stats["providers"])):
+        print(f"\n{title}" + header[len(title):])
+        for name, group in groups.items():
+            print(_row(f"{name} total", group.get("total")))
+            print(_row(f"{name} provider", group.get("provider")))
+            if group.get("avg_tokens"):
+                print(f"{'':<22} ~{group['avg_tokens']} tokens/run")
+            if group.get("prompt_cached_pct") is not None:
+                print(f"{'':<22} {group['prompt_cached_pct']}% of prompt tokens cached")
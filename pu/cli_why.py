@@ -1,40 +1,40 @@
-from openai import OpenAI
-from .history import read_history_jsonl
+from .history import annotate_history_entry, get_history_entry
 
 
 def handle_why(args, config):
-    entries = read_history_jsonl()
-    if not entries:
-        print("No history available.")
-        return
-    entry = entries[-1]
+    index = -1
     if args.index is not None:
         try:
-            idx = int(args.index)
-            if 0 <= idx < len(entries):
-                entry = entries[idx]
-            else:
-                print("Index out of range.")
-                return
+            index = int(args.index)
         except ValueError:
             print("Index must be an integer.")
             return
+        if index < 0:
+            print("Index out of range.")
+            return
+    entry = get_history_entry(index)
+    if entry is None:
+        print("Index out of range." if args.index is not None else "No history available.")
+        return
+    # generated with [openai] explain, or explained before: no request needed
+    if entry.get("explanation"):
+        print(entry["explanation"])
+        return
     prompt = entry.get("prompt", "")
     command = entry.get("command_raw") or entry.get("command")
     model = config["openai"].get("model", "gpt-4o-mini")
     api_key = config["openai"]["api_key"]
+    from .provider import complete_text
+    from .redaction import redact_text
+
     try:
-        client = OpenAI(api_key=api_key)
-        resp = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": "Explain briefly in 3-5 bullets how the given shell command satisfies the user's prompt. Be concise."},
-                {"role": "user", "content": f"Prompt: {prompt}\nCommand: {command}"},
-            ],
-        )
-        explanation = resp.choices[0].message.content.strip()
-        print(explanation)
+        explanation = complete_text("why", prompt, f"Command:\n{command}", model, api_key)
     except Exception as e:
         print(f"Failed to get explanation: {e}")
-
-
+        return
+    if not explanation:
+        print("Failed to get explanation: empty response.")
+        return
+    explanation = redact_text(explanation)
+    print(explanation)
+    annotate_history_entry(entry, {"explanation": explanation})
@@ -1,63 +1,108 @@
 import os
-import subprocess
 from typing import List, Literal
 
 from .redaction import redact_text
 from .risk import analyze_command_risk
 from .dryrun import build_dry_run_preview, review_multiline_command
+from .execute import ExecutionResult, describe_failure, run_command
+from .shellparse import parse_command
 from .history import log_history
+from .timing import Timings
 
 
-def execute_command_flow(command: str, dry_run: bool, prompt: str, provider: str) -> None:
-    redacted_command = redact_text(command)
-    print(f"\n📝 Command generated:\n{redacted_command}\n")
+class StreamPrinter:
+    # on_line callback for streamed generation; redacts line by line and hides private-key blocks
+    def __init__(self):
+        self.shown = False
+        self._in_private_key = False
+
+    def __call__(self, line: str) -> None:
+        if not self.shown:
+            print("\n📝 Command generated:")
+            self.shown = True
+        if "-----BEGIN" in line and "PRIVATE KEY-----" in line:
+            self._in_private_key = True
+            print("<REDACTED-PRIVATE-KEY>", flush=True)
+        if self._in_private_key:
+            if "-----END" in line:
+                self._in_private_key = False
+            return
+        print(redact_text(line), flush=True)
+
+
+def _run_approved(lines_to_run: List[str], timings: Timings) -> ExecutionResult:
+    with timings.span("execute"):
+        result = run_command("\n".join(lines_to_run), cwd=os.getcwd())
+    if not result.ok:
+        print(f"❌ Command failed: {describe_failure(result)}")
+    return result
+
+
+def execute_command_flow(
+    command: str, dry_run: bool, prompt: str, provider: str, shown: bool = False, timings: Timings | None = None, explanation: str | None = None
+) -> None:
+    timings = timings if timings is not None else Timings()
+    if shown:
+        print()
+    else:
+        redacted_command = redact_text(command)
+        print(f"\n📝 Command generated:\n{redacted_command}\n")
 
     executed = False
-    risk, reasons = analyze_command_risk(command)
+    result = None
+    with timings.span("risk"):
+        # parsed once here; risk, preview and review all read the same structure
+        parsed = parse_command(command)
+        risk, reasons = analyze_command_risk(parsed)
 
     if dry_run:
         print("💡 Dry run mode: command not executed.")
         if risk != "low":
             print(f"⚠️ Risk: {risk.upper()} — " + "; ".join(reasons))
-        for hint in build_dry_run_preview(command):
+        for hint in build_dry_run_preview(parsed):
             print("👉 " + hint)
     else:
         if risk == "high":
             print(f"⚠️ This command appears HIGH RISK: " + "; ".join(reasons))
-            first = input("Proceed anyway? [y/N] ").strip().lower()
+            with timings.span("confirm"):
+                first = input("Proceed anyway? [y/N] ").strip().lower()
             if first == "y":
-                challenge = input("Type the exact command to confirm: \n> ").strip()
+                with timings.span("confirm"):
+                    challenge = input("Type the exact command to confirm: \n> ").strip()
                 if challenge != command.strip():
                     print("❌ Confirmation did not match. Cancelled.")
                 else:
-                    lines_to_run = review_multiline_command(command)
+                    with timings.span("confirm"):
+                        lines_to_run = review_multiline_command(parsed)
                     if not lines_to_run:
                         print("❌ Nothing approved to run.")
                     else:
-                        try:
-                            subprocess.run("\n".join(lines_to_run), shell=True, check=True, cwd=os.getcwd())
-                            executed = True
-                        except subprocess.CalledProcessError as e:
-                            print(f"❌ Command failed: {e}")
+                        result = _run_approved(lines_to_run, timings)
+                        executed = result.ok
             else:
                 print("❌ Cancelled.")
         else:
             if risk == "medium":
                 print(f"⚠️ Risk: MEDIUM — " + "; ".join(reasons))
-            confirm = input("Run this command? [y/N] ").strip().lower()
+            with timings.span("confirm"):
+                confirm = input("Run this command? [y/N] ").strip().lower()
             if confirm == "y":
-                lines_to_run = review_multiline_command(command)
+                with timings.span("confirm"):
+                    lines_to_run = review_multiline_command(parsed)
                 if not lines_to_run:
                     print("❌ Nothing approved to run.")
                 else:
-                    try:
-                        subprocess.run("\n".join(lines_to_run), shell=True, check=True, cwd=os.getcwd())
-                        executed = True
-                    except subprocess.CalledProcessError as e:
-                        print(f"❌ Command failed: {e}")
+                    result = _run_approved(lines_to_run, timings)
+                    executed = result.ok
             else:
                 print("❌ Cancelled.")
 
-    log_history(prompt, command, executed, risk, reasons, provider)
+    # executed stays "ran and succeeded"; the execution fields tell failures from commands never run
+    metrics = timings.as_dict()
+    if explanation:
+        metrics["explanation"] = explanation
+    if result is not None:
+        metrics.update(result.as_dict())
+    log_history(prompt, command, executed, risk, reasons, provider, metrics)
 
 
@@ -2,6 +2,9 @@ import os
 import configparser
 from .constants import CONFIG_PATH
 
+# the config of this run, for modules that read their section on first use instead of at startup
+_loaded: configparser.ConfigParser | None = None
+
 
 def load_config() -> configparser.ConfigParser:
     config = configparser.ConfigParser()
@@ -14,6 +17,13 @@ def load_config() -> configparser.ConfigParser:
         }
         with open(CONFIG_PATH, "w") as f:
             config.write(f)
+    global _loaded
+    _loaded = config
     return config
 
 
+def loaded_config() -> configparser.ConfigParser:
+    # empty (all defaults) when pu is used as a library without load_config
+    return _loaded if _loaded is not None else configparser.ConfigParser()
+
+
@@ -3,5 +3,12 @@ from pathlib import Path
 CONFIG_PATH = Path.home() / ".puconfig"
 HISTORY_PATH = Path.home() / ".pu_history"
 HISTORY_JSONL_PATH = Path.home() / ".pu_history.jsonl"
-
-
+CACHE_PATH = Path.home() / ".pu_cache.json"
+TEMPLATE_CACHE_PATH = Path.home() / ".pu_templates.json"
+HISTORY_DB_PATH = Path.home() / ".pu_history.db"
+PROVIDER_HEALTH_PATH = Path.home() / ".pu_provider_health.json"
+CONTEXT_CACHE_PATH = Path.home() / ".pu_context_cache.json"
+DAEMON_SOCKET_PATH = Path.home() / ".pu.sock"
+RETRIEVAL_INDEX_PATH = Path.home() / ".pu_retrieval.jsonl"
+SEARCH_INDEX_PATH = Path.home() / ".pu_history.search.db"
+LATENCY_PATH = Path.home() / ".pu_latency.json"
@@ -0,0 +1,375 @@
+import fnmatch
+import json
+import os
+import re
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Set, Tuple
+
+from .constants import CONTEXT_CACHE_PATH
+
+CACHE_VERSION = 2
+CHARS_PER_TOKEN = 4
+COLLAPSE_THRESHOLD = 40
+SUMMARY_SAMPLES = 3
+MAX_CACHED_DIRECTORIES = 20_000
+DEFAULT_MAX_ENTRIES = 10_000
+
+_STOPWORDS = {
+    "the", "and", "for", "with", "all", "from", "into", "that", "this", "files", "file", "list", "show",
+    "find", "make", "create", "delete", "remove", "run", "use", "using", "each", "every", "directory", "folder",
+}
+
+# (regex, negate, dir_only, anchored, base directory)
+GitignoreRule = Tuple["re.Pattern[str]", bool, bool, bool, str]
+
+
+def _glob_to_regex(pattern: str) -> str:
+    out = []
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if pattern.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+            continue
+        if pattern.startswith("**", i):
+            out.append(".*")
+            i += 2
+            continue
+        if c == "*":
+            out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "[":
+            end = pattern.find("]", i + 1)
+            if end == -1:
+                out.append(re.escape(c))
+            else:
+                body = pattern[i + 1 : end]
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                out.append(f"[{body}]")
+                i = end
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return "".join(out)
+
+
+def parse_gitignore(text: str, base: str) -> List[GitignoreRule]:
+    rules: List[GitignoreRule] = []
+    for line in text.splitlines():
+        line = line.rstrip()
+        if not line or line.startswith("#"):
+            continue
+        negate = line.startswith("!")
+        if negate:
+            line = line[1:]
+        dir_only = line.endswith("/")
+        line = line.rstrip("/")
+        anchored = "/" in line
+        line = line.lstrip("/")
+        if not line:
+            continue
+        rules.append((re.compile(_glob_to_regex(line) + r"\Z"), negate, dir_only, anchored, base))
+    return rules
+
+
+def _load_gitignore(directory: str) -> List[GitignoreRule]:
+    try:
+        with open(os.path.join(directory, ".gitignore"), "r", errors="replace") as f:
+            return parse_gitignore(f.read(), directory)
+    except OSError:
+        return []
+
+
+def _ancestor_gitignore_rules(root: str) -> List[GitignoreRule]:
+    # .gitignore files between the repository root and the starting directory also apply
+    chain: List[str] = []
+    current = os.path.dirname(root)
+    probe = root
+    while not os.path.exists(os.path.join(probe, ".git")):
+        if current == probe:
+            return []
+        chain.append(current)
+        probe, current = current, os.path.dirname(current)
+    rules: List[GitignoreRule] = []
+    for directory in reversed(chain):
+        rules.extend(_load_gitignore(directory))
+    return rules
+
+
+def gitignored(full_path: str, name: str, is_dir: bool, rules: List[GitignoreRule]) -> bool:
+    ignored = False
+    for regex, negate, dir_only, anchored, base in rules:
+        if dir_only and not is_dir:
+            continue
+        target = os.path.relpath(full_path, base) if anchored else name
+        if regex.match(target):
+            ignored = not negate
+    return ignored
+
+
+class ContextNode:
+    __slots__ = ("name", "is_dir", "size", "children", "denied")
+
+    def __init__(self, name: str, is_dir: bool, size: int = 0):
+        self.name = name
+        self.is_dir = is_dir
+        self.size = size
+        # None for files and for directories below the depth limit
+        self.children: List["ContextNode"] | None = None
+        self.denied = False
+
+
+class FileContextWalker:
+    # os.scandir walker whose raw directory listings are cached on disk keyed by directory mtime,
+    # so repeated runs in the same tree only rescan directories whose entries changed
+    def __init__(self, ignore: List[str] | None = None, use_gitignore: bool = True, cache_path: Path | None = CONTEXT_CACHE_PATH):
+        self.ignore_re = re.compile("|".join(fnmatch.translate(p) for p in ignore)) if ignore else None
+        self.use_gitignore = use_gitignore
+        self.cache_path = cache_path
+        self._cache: Dict[str, list] = self._load_cache()
+        self._touched: Set[str] = set()
+        self._dirty = False
+
+    def _load_cache(self) -> Dict[str, list]:
+        if self.cache_path is None:
+            return {}
+        try:
+            with open(self.cache_path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(data, dict) or data.get("version") != CACHE_VERSION:
+            return {}
+        return data.get("dirs", {})
+
+    def save(self) -> None:
+        if self.cache_path is None or not self._dirty:
+            return
+        if len(self._cache) > MAX_CACHED_DIRECTORIES:
+            stale = [k for k in self._cache if k not in self._touched]
+            for key in stale[: len(self._cache) - MAX_CACHED_DIRECTORIES]:
+                del self._cache[key]
+        tmp = self.cache_path.with_name(f"{self.cache_path.name}.{os.getpid()}.tmp")
+        try:
+            with open(tmp, "w") as f:
+                json.dump({"version": CACHE_VERSION, "dirs": self._cache}, f)
+            os.replace(tmp, self.cache_path)
+        except OSError:
+            pass
+
+    def list_directory(self, path: str) -> List[Tuple[str, bool, int]]:
+        # sizes are refreshed only when the directory itself changes, so they are approximate
+        mtime = os.stat(path).st_mtime_ns
+        self._touched.add(path)
+        cached = self._cache.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        entries = []
+        with os.scandir(path) as it:
+            for e in it:
+                is_dir = e.is_dir()
+                try:
+                    size = 0 if is_dir else e.stat(follow_symlinks=False).st_size
+                except OSError:
+                    size = 0
+                entries.append([e.name, is_dir, size])
+        entries.sort(key=lambda e: e[0])
+        self._cache[path] = [mtime, entries]
+        self._dirty = True
+        return entries
+
+    def _ignored(self, name: str, full_path: str, is_dir: bool, rules: List[GitignoreRule]) -> bool:
+        if self.ignore_re is not None and self.ignore_re.match(name):
+            return True
+        if self.use_gitignore:
+            if name == ".git":
+                return True
+            return bool(rules) and gitignored(full_path, name, is_dir, rules)
+        return False
+
+    def build_tree(self, root: Path, depth: int, max_entries: int | None = None) -> ContextNode:
+        root_str = os.path.abspath(root)
+        rules = _ancestor_gitignore_rules(root_str) if self.use_gitignore else []
+        node = ContextNode(os.path.basename(root_str) or root_str, True)
+        self._walk(node, root_str, depth, 0, [max_entries or DEFAULT_MAX_ENTRIES], rules)
+        return node
+
+    def render_tree(self, root: Path, depth: int, max_entries: int | None = None) -> str:
+        lines: List[str] = []
+        _render_plain(self.build_tree(root, depth, max_entries), 0, lines)
+        return "\n".join(lines)
+
+    def _walk(self, node: ContextNode, path: str, depth: int, level: int, remain: List[int], rules: List[GitignoreRule]) -> None:
+        if level >= depth or remain[0] <= 0:
+            return
+        node.children = []
+        try:
+            entries = self.list_directory(path)
+        except PermissionError:
+            node.denied = True
+            return
+        except OSError:
+            return
+        if self.use_gitignore and any(name == ".gitignore" for name, _, _ in entries):
+            rules = rules + _load_gitignore(path)
+        for name, is_dir, size in entries:
+            if remain[0] <= 0:
+                return
+            full_path = os.path.join(path, name)
+            if self._ignored(name, full_path, is_dir, rules):
+                continue
+            child = ContextNode(name, is_dir, size)
+            node.children.append(child)
+            remain[0] -= 1
+            if is_dir:
+                self._walk(child, full_path, depth, level + 1, remain, rules)
+
+
+def _render_plain(node: ContextNode, level: int, lines: List[str]) -> None:
+    indent = "  " * level
+    if node.denied:
+        lines.append(indent + "- [Permission Denied]")
+    for child in node.children or []:
+        lines.append(f"{indent}- {child.name}")
+        if child.is_dir:
+            _render_plain(child, level + 1, lines)
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def prompt_keywords(prompt: str) -> List[str]:
+    words = re.findall(r"[a-z0-9_.-]{3,}", prompt.lower())
+    return [w for w in dict.fromkeys(words) if w not in _STOPWORDS]
+
+
+def _human_size(size: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
+def summarize_entries(entries: List[ContextNode]) -> str:
+    files = [e for e in entries if not e.is_dir]
+    dirs = len(entries) - len(files)
+    exts = Counter(os.path.splitext(e.name)[1].lower() or "(no ext)" for e in files)
+    parts = [f"{len(files)} files", f"{dirs} dirs", _human_size(sum(e.size for e in files))]
+    text = ", ".join(parts)
+    if exts:
+        text += ": " + ", ".join(f"{n} {ext}" for ext, n in exts.most_common(4))
+    samples = [e.name for e in entries[:SUMMARY_SAMPLES]]
+    if samples:
+        text += "; e.g. " + ", ".join(samples)
+    return text
+
+
+class _Item:
+    __slots__ = ("label", "depth", "parent", "relevant", "children", "omitted")
+
+    def __init__(self, label: str, depth: int, parent: "_Item | None", relevant: bool):
+        self.label = label
+        self.depth = depth
+        self.parent = parent
+        self.relevant = relevant
+        self.children: List["_Item"] = []
+        self.omitted: List[ContextNode] = []
+
+    def line(self) -> str:
+        return "  " * self.depth + "- " + self.label
+
+
+def _mark_relevant(node: ContextNode, keywords: List[str], relevant: Set[int]) -> bool:
+    hit = any(k in node.name.lower() for k in keywords)
+    for child in node.children or []:
+        hit = _mark_relevant(child, keywords, relevant) or hit
+    if hit:
+        relevant.add(id(node))
+    return hit
+
+
+def _fold(node: ContextNode) -> Tuple[str, ContextNode]:
+    # collapse single-child directory chains into one "a/b/c/" line
+    label = node.name
+    while node.is_dir and not node.denied and node.children is not None and len(node.children) == 1 and node.children[0].is_dir:
+        node = node.children[0]
+        label += "/" + node.name
+    return (label + "/" if node.is_dir else label), node
+
+
+def _build_items(node: ContextNode, parent: _Item | None, depth: int, relevant: Set[int], items: List[_Item], collapse_threshold: int) -> List[_Item]:
+    children = node.children or []
+    out: List[_Item] = []
+    if node.denied:
+        out.append(_Item("[Permission Denied]", depth, parent, False))
+    summarized: List[ContextNode] = []
+    if len(children) > collapse_threshold:
+        summarized = [c for c in children if id(c) not in relevant]
+        children = [c for c in children if id(c) in relevant]
+    for child in children:
+        label, effective = _fold(child)
+        item = _Item(label, depth, parent, id(child) in relevant)
+        item.children = _build_items(effective, item, depth + 1, relevant, items, collapse_threshold) if effective.is_dir else []
+        out.append(item)
+    if summarized:
+        out.append(_Item(f"[{summarize_entries(summarized)}]", depth, parent, False))
+    items.extend(out)
+    return out
+
+
+def encode_file_context(tree: ContextNode, budget_tokens: int, keywords: List[str] | None = None, collapse_threshold: int = COLLAPSE_THRESHOLD) -> Tuple[str, int]:
+    # keyword-relevant entries are admitted first, then everything else breadth-first,
+    # until the estimated token budget is spent; omitted siblings become a one-line tally
+    relevant: Set[int] = set()
+    if keywords:
+        _mark_relevant(tree, keywords, relevant)
+    items: List[_Item] = []
+    top = _build_items(tree, None, 0, relevant, items, collapse_threshold)
+    order = sorted(range(len(items)), key=lambda i: (not items[i].relevant, items[i].depth, i))
+    included: Set[int] = set()
+    spent = 0
+    limit = int(budget_tokens * 0.9)
+    for i in order:
+        item = items[i]
+        chain = []
+        cursor: _Item | None = item
+        while cursor is not None and id(cursor) not in included:
+            chain.append(cursor)
+            cursor = cursor.parent
+        cost = sum(estimate_tokens(c.line() + "\n") for c in chain)
+        if spent + cost > limit:
+            continue
+        spent += cost
+        included.update(id(c) for c in chain)
+
+    lines: List[str] = []
+
+    def render(level: List[_Item], depth: int) -> None:
+        omitted = [it for it in level if id(it) not in included]
+        for it in level:
+            if id(it) in included:
+                lines.append(it.line())
+                render(it.children, depth + 1)
+        if omitted:
+            lines.append("  " * depth + f"- … +{len(omitted)} more")
+
+    render(top, 0)
+    text = "\n".join(lines)
+    return text, estimate_tokens(text)
+
+
+def build_file_context(root: Path, depth: int, ignore: List[str] | None = None, max_entries: int | None = None, use_gitignore: bool = True, token_budget: int | None = None, prompt: str = "") -> Tuple[str, int]:
+    walker = FileContextWalker(ignore, use_gitignore)
+    if token_budget:
+        tree, tokens = encode_file_context(walker.build_tree(root, depth, max_entries), token_budget, prompt_keywords(prompt))
+    else:
+        tree = walker.render_tree(root, depth, max_entries)
+        tokens = estimate_tokens(tree)
+    walker.save()
+    return tree, tokens
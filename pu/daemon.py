@@ -0,0 +1,119 @@
+import json
+import os
+import socket
+import socketserver
+from pathlib import Path
+from typing import TYPE_CHECKING, TextIO, Tuple
+
+from .constants import DAEMON_SOCKET_PATH
+
+if TYPE_CHECKING:
+    from .timing import Timings
+
+CONNECT_TIMEOUT = 0.5
+RESPONSE_TIMEOUT = 300.0
+
+
+def _handle_request(request: dict) -> dict:
+    op = request.get("op")
+    if op == "ping":
+        return {"ok": True, "pid": os.getpid()}
+    if op == "generate":
+        from .provider import generate_command_with_retries
+        from .timing import Timings
+
+        timings = Timings()
+        command, provider, explanation = generate_command_with_retries(
+            request["prompt"], request.get("context", ""), request["model"], request["api_key"], timings=timings, task=request.get("task", "command")
+        )
+        return {"ok": True, "command": command, "provider": provider, "explanation": explanation, "timings": timings.as_dict()}
+    return {"ok": False, "error": f"unknown op: {op}"}
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            response = _handle_request(json.loads(self.rfile.readline()))
+        except Exception as e:
+            response = {"ok": False, "error": str(e)}
+        self.wfile.write((json.dumps(response) + "\n").encode("utf-8"))
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def request_daemon(payload: dict, socket_path: Path = DAEMON_SOCKET_PATH) -> dict | None:
+    if not socket_path.exists():
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(CONNECT_TIMEOUT)
+            sock.connect(str(socket_path))
+            sock.settimeout(RESPONSE_TIMEOUT)
+            sock.sendall((json.dumps(payload) + "\n").encode("utf-8"))
+            chunks = []
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                if chunk.endswith(b"\n"):
+                    break
+        response = json.loads(b"".join(chunks))
+    except (OSError, ValueError):
+        return None
+    if not isinstance(response, dict) or not response.get("ok"):
+        return None
+    return response
+
+
+def generate_via_daemon(
+    prompt: str, context: str, model: str, api_key: str, timings: "Timings | None" = None, task: str = "command", out: TextIO | None = None
+) -> Tuple[str, str, str | None] | None:
+    import time
+
+    start = time.perf_counter()
+    response = request_daemon(
+        {"op": "generate", "task": task, "prompt": prompt, "context": context, "model": model, "api_key": api_key}
+    )
+    if response is None:
+        return None
+    if timings is not None:
+        timings.add("daemon", (time.perf_counter() - start) * 1000)
+        timings.merge(response.get("timings") or {})
+    if response["provider"] in ("heuristic", "local"):
+        print("⚠️ Model unavailable (reported by pu daemon), using fallback.", file=out)
+    return response["command"], response["provider"], response.get("explanation")
+
+
+def serve(config, socket_path: Path = DAEMON_SOCKET_PATH) -> None:
+    if request_daemon({"op": "ping"}, socket_path) is not None:
+        print(f"pu daemon already running on {socket_path}")
+        return
+    socket_path.unlink(missing_ok=True)
+
+    # warm up everything a request needs before accepting connections
+    from .endpoints import hedge_endpoint, primary_endpoint
+    from .provider import get_client
+
+    primary = primary_endpoint(config["openai"].get("model", "gpt-4o-mini"), config["openai"].get("api_key", ""))
+    try:
+        for endpoint in filter(None, (primary, hedge_endpoint(primary))):
+            get_client(endpoint.api_key, endpoint.base_url)
+    except Exception as e:
+        print(f"⚠️ Could not initialise provider client: {e}")
+
+    old_umask = os.umask(0o177)
+    try:
+        server = _Server(str(socket_path), _Handler)
+    finally:
+        os.umask(old_umask)
+    print(f"pu daemon listening on {socket_path} (pid {os.getpid()}), Ctrl-C to stop")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        socket_path.unlink(missing_ok=True)
@@ -1,43 +1,56 @@
 import re
 from typing import List
 
+from .shellparse import ParsedCommand, parse_command, strip_prefixes
 
-def build_dry_run_preview(command: str) -> List[str]:
-    previews: List[str] = []
-    first_line = command.strip().split("\n", 1)[0].strip()
-    m = re.match(r"^rm\s+(.+)$", first_line)
-    if m:
-        args = m.group(1)
-        tokens = [t for t in re.split(r"\s+", args) if t and not re.match(r"^-[-a-zA-Z0-9]+$", t)]
-        if tokens:
-            targets = " ".join(tokens)
-            previews.append(f"Would remove (preview): ls -ld -- {targets}")
-        else:
-            previews.append("rm arguments not parseable for preview")
-
-    if first_line.startswith("git "):
-        if re.search(r"\b(add|commit|restore|rm|mv)\b", first_line):
-            previews.append("Suggested: git -c color.ui=always status --short")
-        if re.search(r"\b(reset|checkout|switch)\b", first_line):
-            previews.append("Suggested: git --no-pager diff --name-status --cached")
-        if re.search(r"\bpush\b", first_line):
-            previews.append("Suggested: git log --oneline --decorate --graph -20")
-
-    previews.append(f"Trace: set -x; {first_line}")
-    return previews
+_FLAG_RE = re.compile(r"^-[-a-zA-Z0-9]+$")
 
 
-def review_multiline_command(command: str) -> List[str]:
-    lines = [ln for ln in (ln.strip() for ln in command.splitlines()) if ln]
-    if len(lines) <= 1:
-        return lines
-    print("This command has multiple lines. Review each line:")
+def build_dry_run_preview(command: "str | ParsedCommand") -> List[str]:
+    # previews for every simple command in every statement, not only the first line
+    parsed = command if isinstance(command, ParsedCommand) else parse_command(command)
+    previews: List[str] = []
+    for simple in parsed.commands():
+        if simple.header:
+            continue
+        words, _ = strip_prefixes(simple.words)
+        # previews show arguments as written, so globs and variables still expand when they are run
+        raw = simple.raw_words[len(simple.words) - len(words) :]
+        name = words[0].rsplit("/", 1)[-1] if words else ""
+        if name == "rm":
+            targets = [r for w, r in zip(words[1:], raw[1:]) if not _FLAG_RE.match(w)]
+            if targets:
+                previews.append(f"Would remove (preview): ls -ld -- {' '.join(targets)}")
+            else:
+                previews.append("rm arguments not parseable for preview")
+        elif name == "git":
+            subcommand = next((w for w in words[1:] if not w.startswith("-")), "")
+            if subcommand in ("add", "commit", "restore", "rm", "mv"):
+                previews.append("Suggested: git -c color.ui=always status --short")
+            if subcommand in ("reset", "checkout", "switch"):
+                previews.append("Suggested: git --no-pager diff --name-status --cached")
+            if subcommand == "push":
+                previews.append("Suggested: git log --oneline --decorate --graph -20")
+
+    if parsed.statements:
+        trace = f"Trace: set -x; {parsed.statements[0].one_line()}"
+        if len(parsed.statements) > 1:
+            trace += f"  (+{len(parsed.statements) - 1} more statements)"
+        previews.append(trace)
+    return list(dict.fromkeys(previews))
+
+
+def review_multiline_command(command: "str | ParsedCommand") -> List[str]:
+    # one prompt per statement, so continuations, heredocs and if/for blocks are approved as a whole
+    parsed = command if isinstance(command, ParsedCommand) else parse_command(command)
+    statements = [s.text for s in parsed.statements]
+    if len(statements) <= 1:
+        return statements
+    print("This command has multiple statements. Review each one:")
     approved: List[str] = []
-    for idx, ln in enumerate(lines, 1):
-        print(f"[{idx}] {ln}")
-        ans = input("Run this line? [y/N] ").strip().lower()
+    for idx, text in enumerate(statements, 1):
+        print(f"[{idx}] " + text.replace("\n", "\n    "))
+        ans = input("Run this statement? [y/N] ").strip().lower()
         if ans == "y":
-            approved.append(ln)
+            approved.append(text)
     return approved
-
-
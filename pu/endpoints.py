@@ -0,0 +1,95 @@
+import configparser
+import json
+import math
+import os
+import threading
+from typing import Dict, List
+
+from .constants import LATENCY_PATH
+
+# hedge deadline until enough answers have been timed to estimate the p90
+DEFAULT_HEDGE_AFTER_MS = 2000
+MIN_LATENCY_SAMPLES = 20
+MAX_LATENCY_SAMPLES = 200
+
+_settings = {"base_url": None, "explain": False, "hedge": False, "hedge_after_ms": 0, "hedge_model": None, "hedge_base_url": None, "hedge_api_key": None}
+
+
+def configure_endpoints(config: configparser.ConfigParser) -> None:
+    _settings["base_url"] = config.get("openai", "base_url", fallback="").strip() or None
+    _settings["explain"] = config.getboolean("openai", "explain", fallback=False)
+    _settings["hedge"] = config.getboolean("hedge", "enabled", fallback=config.has_section("hedge"))
+    _settings["hedge_after_ms"] = max(0, config.getint("hedge", "after_ms", fallback=0))
+    _settings["hedge_model"] = config.get("hedge", "model", fallback="").strip() or None
+    _settings["hedge_base_url"] = config.get("hedge", "base_url", fallback="").strip() or None
+    _settings["hedge_api_key"] = config.get("hedge", "api_key", fallback="").strip() or None
+
+
+def explain_enabled() -> bool:
+    return _settings["explain"]
+
+
+class Endpoint:
+    # one OpenAI-compatible chat-completions target: the OpenAI API, a proxy or a local model server;
+    # base_url None lets the SDK pick its default (OPENAI_BASE_URL or api.openai.com)
+    def __init__(self, name: str, model: str, api_key: str, base_url: str | None = None):
+        self.name = name
+        self.model = model
+        self.api_key = api_key
+        self.base_url = base_url
+
+    @property
+    def key(self) -> str:
+        return f"{self.base_url or 'default'}|{self.model}"
+
+    def __repr__(self) -> str:
+        return f"Endpoint({self.name!r}, {self.model!r}, base_url={self.base_url!r})"
+
+
+def primary_endpoint(model: str, api_key: str) -> Endpoint:
+    return Endpoint("openai", model, api_key, _settings["base_url"])
+
+
+def hedge_endpoint(primary: Endpoint) -> Endpoint | None:
+    # the alternate a hedged request races against the primary; unset fields inherit from it
+    if not _settings["hedge"]:
+        return None
+    return Endpoint(
+        "hedge",
+        _settings["hedge_model"] or primary.model,
+        _settings["hedge_api_key"] or primary.api_key,
+        _settings["hedge_base_url"] or primary.base_url,
+    )
+
+
+def _load_latencies() -> Dict[str, List[float]]:
+    try:
+        with open(LATENCY_PATH, "r") as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def hedge_after_ms(primary: Endpoint) -> float:
+    # a fixed after_ms wins; otherwise the p90 (nearest rank) of recent time to first token for this endpoint
+    if _settings["hedge_after_ms"]:
+        return float(_settings["hedge_after_ms"])
+    samples = sorted(_load_latencies().get(primary.key) or [])
+    if len(samples) < MIN_LATENCY_SAMPLES:
+        return float(DEFAULT_HEDGE_AFTER_MS)
+    return samples[max(0, math.ceil(0.9 * len(samples)) - 1)]
+
+
+def record_latency(primary: Endpoint, ms: float) -> None:
+    data = _load_latencies()
+    samples = data.get(primary.key) or []
+    samples.append(round(ms, 1))
+    data[primary.key] = samples[-MAX_LATENCY_SAMPLES:]
+    tmp = LATENCY_PATH.with_name(f"{LATENCY_PATH.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, LATENCY_PATH)
+    except OSError:
+        pass
@@ -0,0 +1,147 @@
+import configparser
+import os
+import sys
+import threading
+import time
+from typing import IO, List
+
+DEFAULT_OUTPUT_BYTES = 4096
+READ_SIZE = 64 * 1024
+
+# capture: pipe the child's stdout/stderr through pu (false runs it on the terminal directly, for
+# full-screen programs); output_bytes: how much of the output tail is kept for the history record
+_settings = {"capture": True, "output_bytes": DEFAULT_OUTPUT_BYTES}
+
+
+def configure_execution(config: configparser.ConfigParser) -> None:
+    _settings["capture"] = config.getboolean("execute", "capture", fallback=True)
+    _settings["output_bytes"] = max(0, config.getint("execute", "output_bytes", fallback=DEFAULT_OUTPUT_BYTES))
+
+
+class OutputRing:
+    # keeps the last `limit` bytes written to it; anything older is only counted in `dropped`
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.dropped = 0
+        self._buffer = bytearray()
+        self._lock = threading.Lock()
+
+    def write(self, data: bytes) -> None:
+        with self._lock:
+            self._buffer += data
+            excess = len(self._buffer) - self.limit
+            if excess > 0:
+                del self._buffer[:excess]
+                self.dropped += excess
+
+    def text(self) -> str:
+        with self._lock:
+            data = bytes(self._buffer)
+        if self.dropped:
+            # start at a line boundary rather than inside a line or a multi-byte character
+            newline = data.find(b"\n")
+            if newline != -1:
+                self.dropped += newline + 1
+                data = data[newline + 1 :]
+        return data.decode("utf-8", errors="replace")
+
+
+class ExecutionResult:
+    def __init__(self, exit_code: int, wall_ms: float, cpu_ms: float | None, output: str | None, output_dropped: int = 0):
+        self.exit_code = exit_code
+        self.wall_ms = wall_ms
+        self.cpu_ms = cpu_ms
+        self.output = output
+        self.output_dropped = output_dropped
+
+    @property
+    def ok(self) -> bool:
+        return self.exit_code == 0
+
+    def as_dict(self) -> dict:
+        data = {"exit_code": self.exit_code, "wall_ms": round(self.wall_ms, 1), "cpu_ms": None if self.cpu_ms is None else round(self.cpu_ms, 1)}
+        if self.output is not None:
+            data["output"] = self.output
+            data["output_dropped"] = self.output_dropped
+        return data
+
+
+def _children_cpu_ms() -> float | None:
+    # user + system time of waited-for children, which includes everything the shell ran
+    try:
+        import resource
+    except ImportError:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return (usage.ru_utime + usage.ru_stime) * 1000
+
+
+def _pump(pipe: IO[bytes], out: IO[str], ring: OutputRing) -> None:
+    # copies one child pipe to our terminal as data arrives (no line buffering, so prompts show up)
+    target = getattr(out, "buffer", None)
+    fd = pipe.fileno()
+    try:
+        while True:
+            data = os.read(fd, READ_SIZE)
+            if not data:
+                break
+            ring.write(data)
+            try:
+                if target is not None:
+                    target.write(data)
+                    target.flush()
+                else:
+                    out.write(data.decode("utf-8", errors="replace"))
+                    out.flush()
+            except (OSError, ValueError):
+                pass
+    finally:
+        pipe.close()
+
+
+def redact_output(text: str, truncated: bool) -> str:
+    from .redaction import redact_partial_keys, redact_text
+
+    return redact_text(redact_partial_keys(text, starts_inside=truncated))
+
+
+def run_command(command: str, cwd: str | None = None) -> ExecutionResult:
+    # runs through the shell like subprocess.run(shell=True), streaming output live while its tail
+    # is kept in a bounded ring; the caller decides what a non-zero exit status means
+    import subprocess
+
+    capture = _settings["capture"] and _settings["output_bytes"] > 0
+    ring = OutputRing(_settings["output_bytes"]) if capture else None
+    pipe = subprocess.PIPE if capture else None
+    sys.stdout.flush()
+    sys.stderr.flush()
+    cpu_before = _children_cpu_ms()
+    start = time.perf_counter()
+    process = subprocess.Popen(command, shell=True, cwd=cwd or os.getcwd(), stdout=pipe, stderr=pipe)
+    pumps: List[threading.Thread] = []
+    if ring is not None:
+        for child, out in ((process.stdout, sys.stdout), (process.stderr, sys.stderr)):
+            pump = threading.Thread(target=_pump, args=(child, out, ring), daemon=True)
+            pump.start()
+            pumps.append(pump)
+    try:
+        exit_code = process.wait()
+    except KeyboardInterrupt:
+        # Ctrl-C reached the child too; record how it ended instead of abandoning it
+        exit_code = process.wait()
+    for pump in pumps:
+        pump.join()
+    wall_ms = (time.perf_counter() - start) * 1000
+    cpu_after = _children_cpu_ms()
+    cpu_ms = None if cpu_before is None or cpu_after is None else cpu_after - cpu_before
+    if ring is None:
+        return ExecutionResult(exit_code, wall_ms, cpu_ms, None)
+    text = ring.text()
+    return ExecutionResult(exit_code, wall_ms, cpu_ms, redact_output(text, bool(ring.dropped)), ring.dropped)
+
+
+def describe_failure(result: ExecutionResult) -> str:
+    # negative return codes are signals (e.g. -2 after Ctrl-C)
+    if result.exit_code < 0:
+        return f"terminated by signal {-result.exit_code}"
+    return f"exit status {result.exit_code}"
@@ -1,19 +1,60 @@
 import os
 import ast
+import configparser
+import json
+import threading
+import time
 from datetime import datetime
-from typing import List
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Tuple
 from .constants import HISTORY_PATH, HISTORY_JSONL_PATH
-from .redaction import redact_text
 
+try:
+    import fcntl
+except ImportError:  # Windows: appends rely on O_APPEND alone
+    fcntl = None
 
-def log_history(prompt: str, command: str, executed: bool, risk: str, reasons: List[str], provider: str = "openai"):
-    with open(HISTORY_PATH, "a") as f:
-        f.write(
-            f"[{datetime.now().isoformat()}]\n"
-            f"Prompt: {redact_text(prompt)}\n"
-            f"Command: {redact_text(command)}\n"
-            f"Executed: {executed}\n\n"
-        )
+DEFAULT_MAX_BYTES = 8 * 1024 * 1024
+DEFAULT_GROUP_SIZE = 64
+DEFAULT_GROUP_MS = 200
+FSYNC_POLICIES = ("off", "group", "always")
+# key of annotation records in the JSONL history, see annotate_history_entry
+ANNOTATES = "annotates"
+_ANNOTATES_TOKEN = f'"{ANNOTATES}":'
+
+# "jsonl" (default) appends to ~/.pu_history.jsonl; "sqlite" uses the indexed ~/.pu_history.db
+_settings = {
+    "backend": "jsonl",
+    "legacy_text": True,
+    "max_bytes": DEFAULT_MAX_BYTES,
+    "max_age_days": 0,
+    "max_archives": 0,
+    # off: leave flushing to the OS; group: fsync once per HistoryWriter group commit; always: after every write
+    "fsync": "off",
+    "group_size": DEFAULT_GROUP_SIZE,
+    "group_ms": DEFAULT_GROUP_MS,
+}
+
+
+def configure_history(config: configparser.ConfigParser) -> None:
+    backend = config.get("history", "backend", fallback="jsonl").strip().lower()
+    _settings["backend"] = backend if backend in ("jsonl", "sqlite") else "jsonl"
+    _settings["legacy_text"] = config.getboolean("history", "legacy_text", fallback=True)
+    _settings["max_bytes"] = config.getint("history", "max_bytes", fallback=DEFAULT_MAX_BYTES)
+    _settings["max_age_days"] = config.getint("history", "max_age_days", fallback=0)
+    _settings["max_archives"] = config.getint("history", "max_archives", fallback=0)
+    fsync = config.get("history", "fsync", fallback="off").strip().lower()
+    _settings["fsync"] = fsync if fsync in FSYNC_POLICIES else "off"
+    _settings["group_size"] = max(1, config.getint("history", "group_size", fallback=DEFAULT_GROUP_SIZE))
+    _settings["group_ms"] = max(0, config.getint("history", "group_ms", fallback=DEFAULT_GROUP_MS))
+
+
+def build_history_record(
+    prompt: str, command: str, executed: bool, risk: str, reasons: List[str], provider: str = "openai", metrics: dict | None = None
+) -> dict:
+    from .redaction import redact_text
+
+    # metrics: Timings.as_dict() of the run (timings_ms, retries, usage, model), plus the explanation if any
     record = {
         "ts": datetime.now().isoformat(),
         "prompt": redact_text(prompt),
@@ -24,24 +65,469 @@ def log_history(prompt: str, command: str, executed: bool, risk: str, reasons: L
         "reasons": reasons,
         "cwd": os.getcwd(),
         "provider": provider,
+        **(metrics or {}),
     }
-    with open(HISTORY_JSONL_PATH, "a") as jf:
-        jf.write(f"{record}\n")
+    if record.get("explanation"):
+        record["explanation"] = redact_text(record["explanation"])
+    return record
+
+
+def log_history(prompt: str, command: str, executed: bool, risk: str, reasons: List[str], provider: str = "openai", metrics: dict | None = None):
+    append_history_records([build_history_record(prompt, command, executed, risk, reasons, provider, metrics)])
+
+
+def append_history_records(records: List[dict], sync: bool | None = None) -> None:
+    # sync None follows the fsync policy for a single commit ("always"); HistoryWriter passes its own
+    if not records:
+        return
+    from .retrieval import index_history_records
+
+    index_history_records(records)
+    if _settings["backend"] == "sqlite":
+        from .history_db import insert_records
+
+        insert_records(records)
+        return
+    sync = _settings["fsync"] == "always" if sync is None else sync
+    if _settings["legacy_text"]:
+        _append_locked(
+            HISTORY_PATH,
+            "".join(
+                f"[{r['ts']}]\n"
+                f"Prompt: {r['prompt']}\n"
+                f"Command: {r['command']}\n"
+                f"Executed: {r['executed']}\n\n"
+                for r in records
+            ),
+            sync,
+        )
+    _append_locked(HISTORY_JSONL_PATH, "".join(_format_record(r) for r in records), sync)
+    rotate_history_if_needed()
+
+
+class HistoryWriter:
+    # group commit for bulk writers (pu batch, scripts): records are buffered and written together,
+    # one locked append and at most one fsync per group_size records or group_ms milliseconds,
+    # whichever comes first, and on close. Use as a context manager so the last group is not lost.
+    def __init__(self, group_size: int | None = None, group_ms: int | None = None):
+        self.group_size = group_size or _settings["group_size"]
+        self.group_ms = _settings["group_ms"] if group_ms is None else group_ms
+        self._buffer: List[dict] = []
+        self._first = 0.0
+
+    def append(self, record: dict) -> None:
+        if not self._buffer:
+            self._first = time.monotonic()
+        self._buffer.append(record)
+        if len(self._buffer) >= self.group_size or (time.monotonic() - self._first) * 1000 >= self.group_ms:
+            self.flush()
+
+    def flush(self) -> None:
+        records, self._buffer = self._buffer, []
+        append_history_records(records, sync=_settings["fsync"] != "off")
+
+    def close(self) -> None:
+        self.flush()
+
+    def __enter__(self) -> "HistoryWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def _open_locked(path: Path, flags: int) -> int | None:
+    # an fd for `path` holding an exclusive flock. Rotation renames the live file away while holding
+    # the lock, so a writer that waited re-checks the inode and retries on the new file.
+    # None if the file does not exist (and flags have no O_CREAT).
+    while True:
+        try:
+            fd = os.open(path, flags, 0o600)
+        except FileNotFoundError:
+            return None
+        if fcntl is None:
+            return fd
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            st, fst = os.stat(path), os.fstat(fd)
+            if (st.st_ino, st.st_dev) == (fst.st_ino, fst.st_dev):
+                return fd
+        except FileNotFoundError:
+            pass
+        os.close(fd)
+
+
+def _append_locked(path: Path, text: str, sync: bool = False) -> None:
+    # the whole batch in one write under the lock, so concurrent pu processes never interleave lines
+    fd = _open_locked(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+    try:
+        _write_all(fd, text, sync)
+    finally:
+        # closing the fd releases the lock
+        os.close(fd)
+
+
+def _write_all(fd: int, text: str, sync: bool) -> None:
+    view = memoryview(text.encode("utf-8"))
+    while view:
+        view = view[os.write(fd, view) :]
+    if sync:
+        os.fsync(fd)
+
+
+def _format_record(record: dict) -> str:
+    return json.dumps(record, ensure_ascii=False, default=str) + "\n"
+
+
+def annotate_history_entry(entry: dict, fields: dict) -> bool:
+    # adds fields to a stored record, found by ts and raw command. JSONL history is append-only: an
+    # annotation record {"annotates": {"ts", "command_raw"}, **fields} goes after it and readers merge
+    # the two. Only records still in the live file can be annotated, so an annotation always lands in
+    # the same segment as its record. False if it was not found.
+    if _settings["backend"] == "sqlite":
+        from .history_db import annotate
+
+        return annotate(entry.get("ts"), entry.get("command_raw"), fields)
+    key = _record_key(entry)
+    # the lock keeps rotation from moving the record to an archive between the lookup and the append
+    fd = _open_locked(HISTORY_JSONL_PATH, os.O_RDWR | os.O_APPEND)
+    if fd is None:
+        return False
+    try:
+        with open(fd, "rb", closefd=False) as jf:
+            found = any(ANNOTATES not in r and _record_key(r) == key for r in _reverse_records(jf, 64 * 1024))
+        if found:
+            _write_all(fd, _format_record({ANNOTATES: {"ts": key[0], "command_raw": key[1]}, **fields}), _settings["fsync"] != "off")
+        return found
+    finally:
+        os.close(fd)
+
+
+def _record_key(record: dict) -> tuple:
+    return (record.get("ts"), record.get("command_raw"))
+
+
+def is_annotation(record: dict) -> bool:
+    return ANNOTATES in record
+
+
+def _annotation_fields(record: dict) -> Tuple[tuple, dict] | None:
+    target = record.get(ANNOTATES)
+    if not isinstance(target, dict):
+        return None
+    return _record_key(target), {k: v for k, v in record.items() if k != ANNOTATES}
+
+
+def _annotations(records: Iterable[dict]) -> Dict[tuple, dict]:
+    # later annotations of the same record win field by field
+    notes: Dict[tuple, dict] = {}
+    for record in records:
+        note = _annotation_fields(record)
+        if note is not None:
+            notes[note[0]] = {**notes.get(note[0], {}), **note[1]}
+    return notes
+
+
+def _apply_annotations(records: Iterable[dict], notes: Dict[tuple, dict]) -> Iterator[dict]:
+    # oldest first: annotation records are dropped and their fields merged into the records they name
+    for record in records:
+        if ANNOTATES in record:
+            continue
+        note = notes.get(_record_key(record)) if notes else None
+        yield {**record, **note} if note else record
+
+
+def _apply_annotations_reverse(records: Iterable[dict]) -> Iterator[dict]:
+    # newest first: an annotation is met before its record, so it is held until the record comes by
+    pending: Dict[tuple, dict] = {}
+    for record in records:
+        note = _annotation_fields(record)
+        if note is not None:
+            # an older annotation only fills fields a newer one did not set
+            pending[note[0]] = {**note[1], **pending.get(note[0], {})}
+        elif ANNOTATES not in record:
+            extra = pending.pop(_record_key(record), None) if pending else None
+            yield {**record, **extra} if extra else record
+
+
+def history_archives(path: Path = HISTORY_JSONL_PATH) -> List[Path]:
+    # archive names embed a sortable timestamp, so name order is chronological
+    return sorted(path.parent.glob(path.name + ".[0-9]*.gz"))
+
+
+def _first_record_age_days(path: Path) -> float | None:
+    try:
+        with open(path, "r") as jf:
+            line = jf.readline()
+        # the legacy text log starts each record with a "[ts]" line; JSONL lines are objects
+        ts = line.strip()[1:-1] if line.startswith("[") else _parse_history_line(line)["ts"]
+        return (datetime.now() - datetime.fromisoformat(ts)).total_seconds() / 86400
+    except Exception:
+        return None
+
+
+def _should_rotate(path: Path) -> bool:
+    try:
+        size = path.stat().st_size
+    except OSError:
+        return False
+    if _settings["max_bytes"] and size >= _settings["max_bytes"]:
+        return True
+    if _settings["max_age_days"] and size:
+        age = _first_record_age_days(path)
+        return age is not None and age >= _settings["max_age_days"]
+    return False
+
+
+def _rotate_file(path: Path, force: bool = False) -> Path | None:
+    staging = path.with_name(f"{path.name}.rotating-{os.getpid()}-{threading.get_ident()}")
+    # renamed under the lock, so no append is in flight; writers waiting for it start a fresh live file.
+    # The lock stays held on the renamed file until it is archived, which tells _recover_staged that
+    # this rotation is still in progress.
+    fd = _open_locked(path, os.O_RDONLY)
+    if fd is None:
+        return None
+    try:
+        # another process may have rotated it while we waited
+        if not force and not _should_rotate(path):
+            return None
+        try:
+            os.rename(path, staging)
+        except OSError:
+            return None
+        archive = _archive_staged(path, staging, fd)
+    finally:
+        os.close(fd)
+    return archive
+
+
+def _archive_staged(path: Path, staging: Path, fd: int) -> Path:
+    # compresses the renamed file behind fd into an archive named after its last write, so an archive
+    # recovered late still sorts before the ones rotated since. The archive appears only when complete.
+    import gzip
+    import shutil
+
+    stamp = datetime.fromtimestamp(os.fstat(fd).st_mtime).strftime("%Y%m%dT%H%M%S%f")
+    archive = path.with_name(f"{path.name}.{stamp}.gz")
+    partial = staging.with_name(f"{staging.name}.gz")
+    # 0600 like the live file: archives hold unredacted command_raw. A partial left by a crash may
+    # have been created with other permissions, so it is replaced rather than truncated.
+    partial.unlink(missing_ok=True)
+    out = os.open(partial, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with open(fd, "rb", closefd=False) as src, open(out, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb") as dst:
+        src.seek(0)
+        shutil.copyfileobj(src, dst)
+    os.replace(partial, archive)
+    os.unlink(staging)
+    return archive
+
+
+def _recover_staged(path: Path) -> List[Path]:
+    # archives .rotating-* files left behind by a rotation that died before finishing. One whose lock
+    # is still held belongs to a rotation in progress. Without flock (Windows) the two cannot be told
+    # apart, so leftovers stay where they are.
+    recovered: List[Path] = []
+    if fcntl is None:
+        return recovered
+    for staging in path.parent.glob(path.name + ".rotating-*"):
+        if staging.name.endswith(".gz"):
+            continue
+        try:
+            fd = os.open(staging, os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            # another process may have archived and removed it while we were opening it
+            st, fst = os.stat(staging), os.fstat(fd)
+            if (st.st_ino, st.st_dev) != (fst.st_ino, fst.st_dev):
+                continue
+            recovered.append(_archive_staged(path, staging, fd))
+        except OSError:
+            continue
+        finally:
+            os.close(fd)
+    return recovered
+
+
+def rotate_history_if_needed(force: bool = False) -> List[Path]:
+    rotated: List[Path] = []
+    for path in (HISTORY_JSONL_PATH, HISTORY_PATH):
+        if force or _should_rotate(path):
+            archive = _rotate_file(path, force)
+            # leftovers of a rotation that died are picked up by the next one
+            archives = ([archive] if archive is not None else []) + _recover_staged(path)
+            if archives and _settings["max_archives"]:
+                for old in history_archives(path)[: -_settings["max_archives"]]:
+                    old.unlink(missing_ok=True)
+            rotated.extend(archives)
+    return rotated
+
+
+def _parse_history_line(line: str) -> dict | None:
+    line = line.strip()
+    if not line:
+        return None
+    # JSON since the locked writer; older records are Python reprs
+    try:
+        record = json.loads(line)
+        return record if isinstance(record, dict) else None
+    except ValueError:
+        pass
+    try:
+        return ast.literal_eval(line)
+    except Exception:
+        return None
+
+
+def _iter_archive(path: Path) -> Iterator[dict]:
+    import gzip
+
+    try:
+        with gzip.open(path, "rt") as gf:
+            for line in gf:
+                record = _parse_history_line(line)
+                if record is not None:
+                    yield record
+    except (OSError, EOFError):
+        return
+
+
+def iter_history(path: Path = HISTORY_JSONL_PATH, archives: bool = True) -> Iterator[dict]:
+    # annotations sit in the same segment as their record, so each segment is merged on its own
+    if archives:
+        for archive in history_archives(path):
+            records = list(_iter_archive(archive))
+            yield from _apply_annotations(records, _annotations(records))
+    if not path.exists():
+        return
+    with open(path, "r") as jf:
+        # annotations are rare: find them with a substring scan so the live file is still streamed
+        notes = _annotations(
+            r for r in (_parse_history_line(line) for line in jf if _ANNOTATES_TOKEN in line) if r is not None
+        )
+        jf.seek(0)
+        yield from _apply_annotations((r for r in map(_parse_history_line, jf) if r is not None), notes)
+
+
+def iter_history_reverse(path: Path = HISTORY_JSONL_PATH, block_size: int = 64 * 1024, archives: bool = True) -> Iterator[dict]:
+    # newest first; reads fixed-size blocks backwards from EOF so only the tail is touched,
+    # and archived segments are opened only if the caller keeps consuming past the live file
+    yield from _apply_annotations_reverse(_iter_segments_reverse(path, block_size, archives))
+
+
+def _iter_segments_reverse(path: Path, block_size: int, archives: bool) -> Iterator[dict]:
+    yield from _iter_live_reverse(path, block_size)
+    if archives:
+        for archive in reversed(history_archives(path)):
+            yield from reversed(list(_iter_archive(archive)))
+
+
+def _iter_live_reverse(path: Path, block_size: int) -> Iterator[dict]:
+    if not path.exists():
+        return
+    with open(path, "rb") as jf:
+        yield from _reverse_records(jf, block_size)
+
+
+def _reverse_records(jf, block_size: int) -> Iterator[dict]:
+    # raw records of an open binary file, last line first
+    pos = jf.seek(0, os.SEEK_END)
+    remainder = b""
+    while pos > 0:
+        size = min(block_size, pos)
+        pos -= size
+        jf.seek(pos)
+        lines = (jf.read(size) + remainder).split(b"\n")
+        remainder = lines[0]
+        for raw in reversed(lines[1:]):
+            record = _parse_history_line(raw.decode("utf-8", errors="replace"))
+            if record is not None:
+                yield record
+    record = _parse_history_line(remainder.decode("utf-8", errors="replace"))
+    if record is not None:
+        yield record
+
+
+def iter_recent_history() -> Iterator[dict]:
+    # newest first, for either backend
+    if _settings["backend"] == "sqlite":
+        from .history_db import tail
+
+        yield from reversed(tail())
+        return
+    yield from iter_history_reverse()
 
 
 def read_history_jsonl() -> List[dict]:
+    return list(iter_history())
+
+
+def matches_execution(entry: dict, failed: bool = False, slow_seconds: float | None = None) -> bool:
+    # records written before exit codes were captured have neither field and never match
+    if failed and not entry.get("exit_code"):
+        return False
+    if slow_seconds is not None and (entry.get("wall_ms") or 0) < slow_seconds * 1000:
+        return False
+    return True
+
+
+def tail_history(last: int | None = None, failed: bool = False, slow_seconds: float | None = None) -> List[dict]:
+    # text search is pu.search, which ranks and filters over its own index
+    if _settings["backend"] == "sqlite":
+        from .history_db import tail
+
+        return tail(last, failed, slow_seconds)
+    filtered = failed or slow_seconds is not None
+
+    def wanted(e: dict) -> bool:
+        return not filtered or matches_execution(e, failed, slow_seconds)
+
+    if not last:
+        return [e for e in iter_history() if wanted(e)]
     entries: List[dict] = []
-    if not HISTORY_JSONL_PATH.exists():
-        return entries
-    with open(HISTORY_JSONL_PATH, "r") as jf:
-        for line in jf:
-            line = line.strip()
-            if not line:
-                continue
-            try:
-                entries.append(ast.literal_eval(line))
-            except Exception:
-                continue
+    for e in iter_history_reverse():
+        if wanted(e):
+            entries.append(e)
+            if len(entries) >= last:
+                break
+    entries.reverse()
     return entries
 
 
+def get_history_entry(index: int = -1) -> dict | None:
+    if _settings["backend"] == "sqlite":
+        from .history_db import get
+
+        return get(index)
+    if index < 0:
+        for i, e in enumerate(iter_history_reverse(), 1):
+            if i == -index:
+                return e
+        return None
+    # walk from the nearer end: counting lines is far cheaper than parsing the records on the way
+    total = _count_records()
+    if index >= total:
+        return None
+    if index >= total // 2:
+        return get_history_entry(index - total)
+    for i, e in enumerate(iter_history()):
+        if i == index:
+            return e
+    return None
+
+
+def _count_records(path: Path = HISTORY_JSONL_PATH) -> int:
+    # non-blank lines that are not annotations, in the archives and the live file, without parsing them
+    import gzip
+
+    token = _ANNOTATES_TOKEN.encode("utf-8")
+    total = 0
+    for segment in history_archives(path) + [path]:
+        try:
+            with (gzip.open(segment, "rb") if segment.suffix == ".gz" else open(segment, "rb")) as f:
+                total += sum(1 for line in f if line.strip() and token not in line)
+        except (OSError, EOFError):
+            continue
+    return total
+
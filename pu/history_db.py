@@ -0,0 +1,246 @@
+import json
+import re
+import sqlite3
+import sys
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+from .constants import HISTORY_DB_PATH, HISTORY_PATH
+
+COLUMNS = ["ts", "prompt", "command", "command_raw", "executed", "risk", "reasons", "cwd", "provider"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts TEXT NOT NULL,
+    prompt TEXT,
+    command TEXT,
+    command_raw TEXT,
+    executed INTEGER,
+    risk TEXT,
+    reasons TEXT,
+    cwd TEXT,
+    provider TEXT,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_history_ts ON history(ts);
+CREATE INDEX IF NOT EXISTS ix_history_cwd ON history(cwd);
+CREATE INDEX IF NOT EXISTS ix_history_risk ON history(risk);
+CREATE INDEX IF NOT EXISTS ix_history_provider ON history(provider);
+"""
+
+# databases from before pu history --search kept an FTS5 index in sync through these triggers;
+# search has its own index now (pu.search), so they are dropped instead of being paid for on every write
+DROP_FTS = """
+DROP TRIGGER IF EXISTS history_ai;
+DROP TRIGGER IF EXISTS history_ad;
+DROP TRIGGER IF EXISTS history_au;
+DROP TABLE IF EXISTS history_fts;
+"""
+
+LEGACY_RECORD_RE = re.compile(
+    r"^\[(?P<ts>[^\]\n]+)\]\nPrompt: (?P<prompt>.*?)\nCommand: (?P<command>.*?)\nExecuted: (?P<executed>True|False)\n",
+    re.MULTILINE | re.DOTALL,
+)
+
+_conn: sqlite3.Connection | None = None
+_lock = threading.Lock()
+
+
+def connect(path: Path = HISTORY_DB_PATH) -> sqlite3.Connection:
+    global _conn
+    with _lock:
+        if _conn is not None:
+            return _conn
+        created = not path.exists()
+        conn = sqlite3.connect(str(path), check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        try:
+            conn.executescript(DROP_FTS)
+        except sqlite3.OperationalError:
+            # an SQLite built without FTS5 cannot drop an FTS5 table, but it could not have created one either
+            pass
+        conn.commit()
+        migrated = migrate_from_files(conn) if created else 0
+        _conn = conn
+    if migrated:
+        # stderr: this can happen inside pu batch, whose stdout is JSONL
+        print(f"📦 Migrated {migrated} history records into {path}", file=sys.stderr)
+    return conn
+
+
+def _to_row(record: dict) -> tuple:
+    extra = {k: v for k, v in record.items() if k not in COLUMNS}
+    return (
+        record.get("ts"),
+        record.get("prompt"),
+        record.get("command"),
+        record.get("command_raw"),
+        None if record.get("executed") is None else int(bool(record.get("executed"))),
+        record.get("risk"),
+        json.dumps(record.get("reasons") or []),
+        record.get("cwd"),
+        record.get("provider"),
+        json.dumps(extra) if extra else None,
+    )
+
+
+def _from_row(row: tuple) -> dict:
+    ts, prompt, command, command_raw, executed, risk, reasons, cwd, provider, extra = row
+    record = {
+        "ts": ts,
+        "prompt": prompt,
+        "command": command,
+        "command_raw": command_raw,
+        "executed": None if executed is None else bool(executed),
+        "risk": risk,
+        "reasons": json.loads(reasons) if reasons else [],
+        "cwd": cwd,
+        "provider": provider,
+    }
+    if extra:
+        record.update(json.loads(extra))
+    return record
+
+
+_SELECT = "SELECT ts, prompt, command, command_raw, executed, risk, reasons, cwd, provider, extra FROM history"
+
+
+def insert_records(records: Iterable[dict], conn: sqlite3.Connection | None = None) -> int:
+    conn = conn or connect()
+    with _lock, conn:
+        return _insert(conn, records)
+
+
+def _insert(conn: sqlite3.Connection, records: Iterable[dict]) -> int:
+    rows = [_to_row(r) for r in records]
+    conn.executemany(
+        "INSERT INTO history (ts, prompt, command, command_raw, executed, risk, reasons, cwd, provider, extra) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        rows,
+    )
+    return len(rows)
+
+
+def annotate(ts: str | None, command_raw: str | None, fields: dict, conn: sqlite3.Connection | None = None) -> bool:
+    # merges fields into the extra column of the newest record with this ts and raw command
+    conn = conn or connect()
+    with _lock, conn:
+        row = conn.execute(
+            "SELECT id, extra FROM history WHERE ts = ? AND command_raw IS ? ORDER BY id DESC LIMIT 1", (ts, command_raw)
+        ).fetchone()
+        if row is None:
+            return False
+        extra = {**(json.loads(row[1]) if row[1] else {}), **fields}
+        conn.execute("UPDATE history SET extra = ? WHERE id = ?", (json.dumps(extra), row[0]))
+    return True
+
+
+def rows_after(last_id: int, conn: sqlite3.Connection | None = None) -> List[Tuple[int, dict]]:
+    conn = conn or connect()
+    rows = conn.execute(_SELECT.replace("SELECT ", "SELECT id, ", 1) + " WHERE id > ? ORDER BY id", (last_id,)).fetchall()
+    return [(row[0], _from_row(row[1:])) for row in rows]
+
+
+def by_ids(ids: List[int], conn: sqlite3.Connection | None = None) -> Dict[int, dict]:
+    conn = conn or connect()
+    rows = conn.execute(_SELECT.replace("SELECT ", "SELECT id, ", 1) + f" WHERE id IN ({', '.join('?' for _ in ids)})", ids)
+    return {row[0]: _from_row(row[1:]) for row in rows}
+
+
+def tail(last: int | None = None, failed: bool = False, slow_seconds: float | None = None) -> List[dict]:
+    conn = connect()
+    clauses, params = [], []
+    # execution results live in the extra JSON column
+    if failed:
+        clauses.append("coalesce(json_extract(extra, '$.exit_code'), 0) != 0")
+    if slow_seconds is not None:
+        clauses.append("coalesce(json_extract(extra, '$.wall_ms'), 0) >= ?")
+        params.append(slow_seconds * 1000)
+    where = " WHERE " + " AND ".join(clauses) if clauses else ""
+    sql = _SELECT + where + " ORDER BY id DESC"
+    if last:
+        sql += " LIMIT ?"
+        params.append(last)
+    rows = conn.execute(sql, params).fetchall()
+    return [_from_row(r) for r in reversed(rows)]
+
+
+def get(index: int) -> dict | None:
+    conn = connect()
+    order = "ASC" if index >= 0 else "DESC"
+    offset = index if index >= 0 else -index - 1
+    row = conn.execute(_SELECT + f" ORDER BY id {order} LIMIT 1 OFFSET ?", (offset,)).fetchone()
+    return _from_row(row) if row else None
+
+
+def _parse_legacy_text(text: str) -> List[dict]:
+    records = []
+    for m in LEGACY_RECORD_RE.finditer(text):
+        records.append(
+            {
+                "ts": m.group("ts"),
+                "prompt": m.group("prompt"),
+                "command": m.group("command"),
+                "executed": m.group("executed") == "True",
+                "risk": "",
+                "reasons": [],
+                "provider": "legacy",
+            }
+        )
+    return records
+
+
+def _parse_ts(value) -> datetime | None:
+    # None for an empty or malformed ts; such records are migrated but never deduplicated
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _is_duplicate(legacy: dict, seen: Dict[Tuple[str, str], List[datetime]]) -> bool:
+    ts = _parse_ts(legacy["ts"])
+    if ts is None:
+        return False
+    return any(abs((ts - other).total_seconds()) < 1 for other in seen.get((legacy["prompt"], legacy["command"]), []))
+
+
+def migrate_from_files(conn: sqlite3.Connection) -> int:
+    # called with _lock held. BEGIN IMMEDIATE takes the database write lock before the emptiness
+    # check, so when several processes create the database at once only the first one migrates.
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        migrated = 0
+        if conn.execute("SELECT 1 FROM history LIMIT 1").fetchone() is None:
+            migrated = _insert(conn, _records_from_files())
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return migrated
+
+
+def _records_from_files() -> List[dict]:
+    from .history import read_history_jsonl
+
+    # ts is NOT NULL: a record without a string ts is kept with an empty one, which sorts first
+    records = [r if isinstance(r.get("ts"), str) else {**r, "ts": ""} for r in read_history_jsonl()]
+    if HISTORY_PATH.exists():
+        try:
+            legacy = _parse_legacy_text(HISTORY_PATH.read_text(errors="replace"))
+        except OSError:
+            legacy = []
+        # the legacy text file duplicates every JSONL record, written a moment earlier
+        seen: Dict[Tuple[str, str], List[datetime]] = {}
+        for r in records:
+            ts = _parse_ts(r.get("ts"))
+            if ts is not None:
+                seen.setdefault((r.get("prompt"), r.get("command")), []).append(ts)
+        legacy = [r for r in legacy if not _is_duplicate(r, seen)]
+        records = sorted(legacy + records, key=lambda r: r["ts"])
+    return records
@@ -1,9 +1,32 @@
+import queue
 import re
+import threading
 import time
-from typing import Tuple
-from openai import OpenAI
+from typing import TYPE_CHECKING, Callable, Dict, List, Set, TextIO, Tuple
 import shlex
 
+from .prompts import EXPLAIN_MARKER
+
+if TYPE_CHECKING:
+    from .endpoints import Endpoint
+    from .timing import Timings
+
+_clients: Dict[Tuple[str, str | None], object] = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(api_key: str, base_url: str | None = None):
+    # one client per key and endpoint so the underlying HTTP connection pool is reused across calls;
+    # SDK-level retries are disabled because generate_command_with_retries owns the retry policy
+    with _clients_lock:
+        client = _clients.get((api_key, base_url))
+        if client is None:
+            from openai import OpenAI
+
+            client = OpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+            _clients[(api_key, base_url)] = client
+        return client
+
 
 def heuristic_command_from_prompt(prompt: str) -> str:
     p = prompt.lower().strip()
@@ -24,35 +47,411 @@ def heuristic_command_from_prompt(prompt: str) -> str:
     return f"echo {shlex.quote(prompt)}"
 
 
-def generate_command_with_retries(prompt: str, context: str, model: str, api_key: str) -> Tuple[str, str]:
-    last_error: str | None = None
-    for attempt in range(3):
+_FENCE_OPEN_RE = re.compile(r"```[a-zA-Z]*")
+_EXPLAIN_RE = re.compile(rf"^[ \t]*{re.escape(EXPLAIN_MARKER)}[ \t]*$", re.MULTILINE)
+
+
+def clean_command(text: str) -> str:
+    command = re.sub(r"^```[a-zA-Z]*\n?|```$", "", text.strip()).strip()
+    return "\n".join(" ".join(line.split()) for line in command.splitlines())
+
+
+def split_explanation(text: str) -> Tuple[str, str | None]:
+    # (cleaned command, explanation or None when the reply has no marker line)
+    match = _EXPLAIN_RE.search(text)
+    if match is None:
+        return clean_command(text), None
+    return clean_command(text[: match.start()]), text[match.end() :].strip().strip("`").strip() or None
+
+
+class StreamCleaner:
+    # incremental clean_command(): emits each finished, whitespace-normalized line as soon as
+    # its newline arrives; blank lines and bare fences are held back until more text follows them
+    def __init__(self, on_line: Callable[[str], None]):
+        self.on_line = on_line
+        self.buffer = ""
+        self.lines: List[str] = []
+        self.pending: List[str] = []
+        self.started = False
+        # lines after the explanation marker are collected here instead of being emitted
+        self.explanation: List[str] | None = None
+
+    def feed(self, text: str) -> None:
+        self.buffer += text
+        while "\n" in self.buffer:
+            line, self.buffer = self.buffer.split("\n", 1)
+            self._line(line)
+
+    def _line(self, raw: str) -> None:
+        if self.explanation is not None:
+            self.explanation.append(raw.rstrip())
+            return
+        line = " ".join(raw.split())
+        if line == EXPLAIN_MARKER:
+            self.explanation = []
+            self.pending = []
+            return
+        if not self.started:
+            if not line:
+                return
+            self.started = True
+            if _FENCE_OPEN_RE.fullmatch(line):
+                return
+        if not line or line == "```":
+            self.pending.append(line)
+            return
+        for held in self.pending:
+            self._emit(held)
+        self.pending = []
+        self._emit(line)
+
+    def _emit(self, line: str) -> None:
+        self.lines.append(line)
+        self.on_line(line)
+
+    def finish(self) -> str:
+        if self.explanation is not None:
+            self._line(self.buffer)
+            self.buffer = ""
+            return "\n".join(self.lines)
+        line = " ".join(self.buffer.split())
+        self.buffer = ""
+        if line.endswith("```"):
+            line = line[:-3].rstrip()
+        if line:
+            self._line(line)
+        self.pending = []
+        return "\n".join(self.lines)
+
+
+    def explanation_text(self) -> str | None:
+        if self.explanation is None:
+            return None
+        return "\n".join(self.explanation).strip().strip("`").strip() or None
+
+
+class _HedgeLost(Exception):
+    pass
+
+
+# base URLs of endpoints that rejected stream_options; OpenAI-compatible servers do not all know it
+_no_stream_usage: Set[str] = set()
+
+
+def _create_stream(client, model: str, messages: List[dict]):
+    # asks for a final usage chunk; an endpoint that answers 400 to that is retried once without it,
+    # and remembered only when the plain request goes through (a 400 for any other reason fails again)
+    endpoint = str(client.base_url)
+    if endpoint not in _no_stream_usage:
         try:
-            client = OpenAI(api_key=api_key)
-            response = client.chat.completions.create(
-                model=model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": (
-                            "You are a helpful CLI assistant. "
-                            "Output only the raw shell command, without explanations, without markdown, without code fences."
-                        ),
-                    },
-                    {"role": "user", "content": prompt + context},
-                ],
+            return client.chat.completions.create(model=model, messages=messages, stream=True, stream_options={"include_usage": True})
+        except Exception as e:
+            if getattr(e, "status_code", None) != 400:
+                raise
+    stream = client.chat.completions.create(model=model, messages=messages, stream=True)
+    _no_stream_usage.add(endpoint)
+    return stream
+
+
+def _stream_completion(
+    client,
+    model: str,
+    messages: List[dict],
+    on_line: Callable[[str], None],
+    timings: "Timings | None" = None,
+    claim: Callable[[], bool] | None = None,
+) -> Tuple[str, str | None]:
+    # (command, explanation or None). claim, when given, is asked once the first content arrives;
+    # if another request already answered, the stream is closed (dropping its connection) and
+    # _HedgeLost is raised
+    cleaner = StreamCleaner(on_line)
+    start = time.perf_counter()
+    stream = _create_stream(client, model, messages)
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            if claim is not None:
+                if not claim():
+                    stream.close()
+                    raise _HedgeLost()
+                claim = None
+            if timings is not None and "first_token" not in timings.phases:
+                timings.add("first_token", (time.perf_counter() - start) * 1000)
+            cleaner.feed(chunk.choices[0].delta.content)
+        # with include_usage the last chunk carries the token counts and no choices
+        if timings is not None and getattr(chunk, "usage", None):
+            timings.add_usage(chunk.usage)
+    return cleaner.finish(), cleaner.explanation_text()
+
+
+def _is_retryable(error: Exception) -> bool:
+    # auth, permission and malformed-request errors will not succeed on a second try
+    if isinstance(error, ImportError):
+        return False
+    try:
+        import openai
+    except ImportError:
+        return False
+    return not isinstance(
+        error,
+        (
+            openai.AuthenticationError,
+            openai.PermissionDeniedError,
+            openai.BadRequestError,
+            openai.NotFoundError,
+            openai.UnprocessableEntityError,
+        ),
+    )
+
+
+def _backoff_delay(error: Exception, attempt: int) -> float:
+    # honour the server's Retry-After on rate limits instead of the fixed exponential schedule
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    retry_after = headers.get("retry-after") if hasattr(headers, "get") else None
+    if retry_after:
+        try:
+            return min(float(retry_after), 30.0)
+        except ValueError:
+            pass
+    return 0.5 * (2 ** attempt)
+
+
+# monotonic time until which every request in this process holds off after a 429, so one burst of
+# rate limiting pauses all pu batch workers (or daemon threads) instead of each running into it
+_rate_limit = {"until": 0.0}
+_rate_limit_lock = threading.Lock()
+
+
+def _note_rate_limit(error: Exception, delay: float) -> None:
+    if getattr(error, "status_code", None) != 429:
+        return
+    with _rate_limit_lock:
+        _rate_limit["until"] = max(_rate_limit["until"], time.monotonic() + delay)
+
+
+def _rate_limit_wait() -> float:
+    return max(0.0, _rate_limit["until"] - time.monotonic())
+
+
+def _hedged_completion(
+    endpoints: "List[Endpoint]", clients: list, after: float, messages: List[dict], on_line: Callable[[str], None] | None, timings: "Timings"
+) -> "Tuple[str, str | None, Endpoint, float | None]":
+    # starts the first endpoint and sends the next one when no request has produced its first token
+    # within `after` seconds, or as soon as every request in flight has failed. The first request to
+    # produce content wins and is the only one shown; the others are closed when their first chunk
+    # arrives. A request still waiting for response headers cannot be interrupted, so it runs on in a
+    # daemon thread and is dropped. Returns (command, explanation, winner, time to first token in ms),
+    # the latter None when a hedge was sent, since it then says nothing about the primary on its own.
+    from .timing import Timings
+
+    # (endpoint index, "first" | "done" | "error", (command, explanation) or exception)
+    results: "queue.Queue[Tuple[int, str, object]]" = queue.Queue()
+    owner: List[int] = []
+    owner_lock = threading.Lock()
+    attempt_timings = [Timings() for _ in endpoints]
+
+    def claim(i: int) -> bool:
+        with owner_lock:
+            if not owner:
+                owner.append(i)
+                results.put((i, "first", None))
+            return owner[0] == i
+
+    def run(i: int) -> None:
+        try:
+            reply = _stream_completion(
+                clients[i], endpoints[i].model, messages, on_line or (lambda line: None), attempt_timings[i], lambda: claim(i)
             )
-            command = response.choices[0].message.content.strip()
-            command = re.sub(r"^```[a-zA-Z]*\n?|```$", "", command).strip()
-            command = "\n".join(" ".join(line.split()) for line in command.splitlines())
-            return command, "openai"
+            results.put((i, "done", reply))
         except Exception as e:
-            last_error = str(e)
-            time.sleep(0.5 * (2 ** attempt))
+            results.put((i, "error", e))
+
+    def launch(i: int) -> None:
+        threading.Thread(target=run, args=(i,), daemon=True).start()
+
+    start = time.perf_counter()
+    launch(0)
+    started = 1
+    deadline = start + after
+    first_ms: float | None = None
+    errors: Dict[int, Exception] = {}
+    while True:
+        waiting = first_ms is None and started < len(endpoints)
+        try:
+            i, kind, value = results.get(timeout=max(0.0, deadline - time.perf_counter()) if waiting else None)
+        except queue.Empty:
+            timings.hedged = True
+            launch(started)
+            started += 1
+            deadline = time.perf_counter() + after
+            continue
+        if kind == "first":
+            first_ms = (time.perf_counter() - start) * 1000
+            continue
+        if kind == "done" and value[0]:
+            timings.merge(attempt_timings[i].as_dict())
+            return value[0], value[1], endpoints[i], None if started > 1 else first_ms
+        error = value if kind == "error" else ValueError(f"empty response from {endpoints[i].model}")
+        if owner and owner[0] == i:
+            # the answering stream broke after showing output; the others can no longer take over
+            raise error
+        errors[i] = error
+        if len(errors) < started:
+            continue
+        if started < len(endpoints):
+            timings.hedged = True
+            launch(started)
+            started += 1
+            deadline = time.perf_counter() + after
             continue
-    fallback = heuristic_command_from_prompt(prompt)
+        # every request failed before producing content; report the primary's error
+        raise next((e for e in errors.values() if not isinstance(e, _HedgeLost)), errors[0])
+
+
+def complete_text(task: str, request: str, context: str, model: str, api_key: str) -> str:
+    # one plain request whose reply is prose rather than a command (pu why): returned as written, with
+    # no command cleanup, retries, fallback, circuit breaker or latency bookkeeping. Errors propagate.
+    from .endpoints import primary_endpoint
+    from .prompts import build_messages
+
+    endpoint = primary_endpoint(model, api_key)
+    client = get_client(endpoint.api_key, endpoint.base_url)
+    response = client.chat.completions.create(model=endpoint.model, messages=build_messages(task, request, context))
+    return (response.choices[0].message.content or "").strip()
+
+
+def fallback_command(prompt: str, out: TextIO | None = None) -> Tuple[str, str]:
+    # the closest executed prompt from history if it is similar enough, else the keyword heuristic;
+    # the matched prompt is shown so a reused command is never confirmed blind
+    from .retrieval import lookup_command
+
+    match = lookup_command(prompt)
+    if match is not None:
+        print(f"📚 Reusing the command run for \"{match[2]}\" (similarity {match[1]:.2f})", file=out)
+        return match[0], "local"
+    return heuristic_command_from_prompt(prompt), "heuristic"
+
+
+def generate_command_with_retries(
+    prompt: str,
+    context: str,
+    model: str,
+    api_key: str,
+    on_line: Callable[[str], None] | None = None,
+    timings: "Timings | None" = None,
+    task: str = "command",
+    out: TextIO | None = None,
+) -> Tuple[str, str, str | None]:
+    # (command, provider, explanation); warnings are printed to out (stdout when None). task picks the request layout in pu.prompts (command, edit);
+    # with [openai] explain a command request also returns an explanation, else it is None. A reply
+    # without the marker line still has a usable command; it is returned with no explanation.
+    from .breaker import CircuitBreaker
+    from .endpoints import explain_enabled, hedge_after_ms, hedge_endpoint, primary_endpoint, record_latency
+    from .prompts import PROMPT_VERSION, build_messages
+    from .timing import Timings
+
+    timings = timings if timings is not None else Timings()
+    timings.model = model
+    timings.prompt_version = PROMPT_VERSION
+    if task == "command" and explain_enabled():
+        task = "command_explained"
+    messages = build_messages(task, prompt, context)
+
+    primary = primary_endpoint(model, api_key)
+    alternate = hedge_endpoint(primary)
+    endpoints = [primary] + ([alternate] if alternate is not None else [])
+    breaker = CircuitBreaker()
+    state = breaker.state()
+    if state == "open":
+        if alternate is None:
+            print(f"⚠️ Model marked unavailable (retrying in {breaker.retry_in()}s), using fallback. Last error: {breaker.last_error()}", file=out)
+            return (*fallback_command(prompt, out), None)
+        # skip the primary's deadline and go straight to the alternate while the circuit is open
+        endpoints = [alternate]
+    # a half-open breaker gets a single probe attempt
+    attempts = 1 if state == "half_open" else 3
+    last_error: str | None = None
+    retryable = True
+    for attempt in range(attempts):
+        emitted: List[str] = []
+        timings.retries = attempt
+        show = None if on_line is None else (lambda line: (emitted.append(line), on_line(line)))
+        wait = _rate_limit_wait()
+        if wait:
+            with timings.span("backoff"):
+                time.sleep(wait)
+        try:
+            # the first call imports the SDK, which dominates a cold run
+            with timings.span("client"):
+                clients = [get_client(e.api_key, e.base_url) for e in endpoints]
+            # time to the primary's first token when it answered without a hedge; the hedge deadline
+            # is derived from these samples, so answers from the alternate or after a hedge are left out
+            first_ms: float | None = None
+            start = time.perf_counter()
+
+            def first_token() -> bool:
+                nonlocal first_ms
+                first_ms = (time.perf_counter() - start) * 1000
+                return True
+
+            with timings.span("provider"):
+                if len(endpoints) > 1:
+                    command, explanation, winner, first_ms = _hedged_completion(
+                        endpoints, clients, hedge_after_ms(primary) / 1000, messages, show, timings
+                    )
+                elif show is not None:
+                    winner = endpoints[0]
+                    command, explanation = _stream_completion(clients[0], winner.model, messages, show, timings, first_token)
+                else:
+                    winner = endpoints[0]
+                    response = clients[0].chat.completions.create(model=winner.model, messages=messages)
+                    first_token()
+                    command, explanation = split_explanation(response.choices[0].message.content)
+                    if getattr(response, "usage", None):
+                        timings.add_usage(response.usage)
+            timings.model, timings.endpoint = winner.model, winner.name
+            if alternate is not None and winner is primary and first_ms is not None:
+                record_latency(primary, first_ms)
+            # an answer from the alternate says nothing about the primary's health
+            if winner is primary:
+                breaker.record_success()
+            if task == "command_explained" and explanation is None:
+                print(f"⚠️ Reply from {winner.model} had no explanation; `pu why` can ask for one.", file=out)
+            return command, "openai", explanation
+        except Exception as e:
+            last_error = str(e)
+            retryable = _is_retryable(e)
+            if not retryable or attempt == attempts - 1:
+                break
+            if emitted:
+                print(f"\n⚠️ Stream interrupted ({last_error}), retrying...", file=out)
+            delay = _backoff_delay(e, attempt)
+            _note_rate_limit(e, delay)
+            with timings.span("backoff"):
+                time.sleep(delay)
+    # a half-open probe has to settle the circuit, so even an auth or bad-request error re-opens it
+    if (retryable or state == "half_open") and primary in endpoints:
+        breaker.record_failure(last_error or "")
     if last_error:
-        print(f"⚠️ Model unavailable, using fallback. Reason: {last_error}")
-    return fallback, "heuristic"
+        print(f"⚠️ Model unavailable, using fallback. Reason: {last_error}", file=out)
+    return (*fallback_command(prompt, out), None)
+
 
+def generate_command(
+    prompt: str,
+    context: str,
+    model: str,
+    api_key: str,
+    on_line: Callable[[str], None] | None = None,
+    timings: "Timings | None" = None,
+    task: str = "command",
+    out: TextIO | None = None,
+) -> Tuple[str, str, str | None]:
+    # the daemon answers with the whole reply at once, so a streamed request is made in-process
+    if on_line is None:
+        from .daemon import generate_via_daemon
 
+        result = generate_via_daemon(prompt, context, model, api_key, timings, task, out)
+        if result is not None:
+            return result
+    return generate_command_with_retries(prompt, context, model, api_key, on_line, timings, task, out)
@@ -1,15 +1,136 @@
 import re
+from typing import Iterable, Iterator, List, Tuple
+
+# (name, pattern, replacement); a replacement may reference the rule's own named groups
+Rule = Tuple[str, str, str]
+
+# order matters where rules can start at the same position: private-key blocks swallow their
+# whole body, and the aws key rule must win over the generic *_SECRET rule
+RULES: List[Rule] = [
+    ("private_key", r"-----BEGIN [A-Z ]*PRIVATE KEY-----[\s\S]*?-----END [A-Z ]*PRIVATE KEY-----", "<REDACTED-PRIVATE-KEY>"),
+    ("aws_secret", r"(?i:aws_secret_access_key)\s*[:=]\s*\S+", "aws_secret_access_key=***"),
+    # anchored on the keyword rather than the start of the name (DB_ in DB_PASSWORD is kept as is);
+    # the value may itself be a bearer token, which has to go as a whole
+    ("assignment", r"(?i:(?P<assignment_key>PASSWORD|SECRET|TOKEN|API_KEY)\s*[:=]\s*(?:bearer\s+[A-Za-z0-9._-]+|\S+))", "{assignment_key}=***"),
+    ("bearer", r"(?i:bearer)\s+[A-Za-z0-9._-]+", "Bearer ***"),
+    ("openai_key", r"sk-[A-Za-z0-9]{20,}", "sk-***"),
+    ("jwt", r"eyJ[A-Za-z0-9_-]{10,}\.[A-Za-z0-9._-]+\.[A-Za-z0-9._-]+", "***.***.***"),
+    ("aws_key_id", r"AKIA[0-9A-Z]{16}", "AKIA****************"),
+]
+
+# every rule above starts with one of these; checking it first lets most positions fail fast
+FIRST_CHARS = "-AaBbEePpSsTt"
+
+_KEY_BEGIN_RE = re.compile(r"-----BEGIN [A-Z ]*PRIVATE KEY-----")
+_KEY_END_RE = re.compile(r"-----END [A-Z ]*PRIVATE KEY-----")
+
+# no single secret is longer than this, so text further back than this from the end of the buffer is final
+DEFAULT_OVERLAP = 4096
+# an unterminated private-key block is held in memory up to this size, then dropped while streaming
+MAX_KEY_BLOCK = 1 << 20
+
+
+class Redactor:
+    # all rules compiled once into a single alternation so a text is scanned and copied once
+    def __init__(self, rules: List[Rule] = RULES, first_chars: str | None = FIRST_CHARS):
+        self.rules = {name: replacement for name, _, replacement in rules}
+        alternation = "|".join(f"(?P<{name}>{pattern})" for name, pattern, _ in rules)
+        if first_chars:
+            alternation = f"(?=[{re.escape(first_chars)}])(?:{alternation})"
+        self.pattern = re.compile(alternation)
+
+    def _replace(self, m: "re.Match[str]") -> str:
+        name = m.lastgroup
+        replacement = self.rules[name]
+        if "{" not in replacement:
+            return replacement
+        return replacement.format(**{k: v for k, v in m.groupdict().items() if k.startswith(name + "_")})
+
+    def redact(self, text: str) -> str:
+        return self.pattern.sub(self._replace, text)
+
+    def _drain(self, buffer: str, overlap: int) -> Tuple[str, str]:
+        # redacts the part of the buffer that no later input can change; returns (output, rest)
+        limit = len(buffer) - overlap
+        begin = _KEY_BEGIN_RE.search(buffer)
+        while begin and begin.start() < limit:
+            end = _KEY_END_RE.search(buffer, begin.end())
+            if end is None:
+                limit = begin.start()
+                break
+            begin = _KEY_BEGIN_RE.search(buffer, end.end())
+        parts: List[str] = []
+        pos = 0
+        for m in self.pattern.finditer(buffer):
+            if m.start() >= limit:
+                break
+            if m.end() > limit:
+                limit = m.start()
+                break
+            parts.append(buffer[pos : m.start()])
+            parts.append(self._replace(m))
+            pos = m.end()
+        parts.append(buffer[pos:limit])
+        return "".join(parts), buffer[limit:]
+
+    def redact_stream(self, chunks: Iterable[str], overlap: int = DEFAULT_OVERLAP) -> Iterator[str]:
+        # memory stays around 2 * overlap, plus a private-key block while its END line is pending
+        buffer = ""
+        # held: the buffer starts with a private-key block whose END has not arrived yet
+        # dropping: an oversized block was already replaced; discard input up to its END
+        held = dropping = False
+        for chunk in chunks:
+            scanned = max(0, len(buffer) - overlap)
+            buffer += chunk
+            if held or dropping:
+                end = _KEY_END_RE.search(buffer, scanned)
+                if end is None:
+                    if dropping:
+                        buffer = buffer[-overlap:]
+                    elif len(buffer) > MAX_KEY_BLOCK:
+                        yield "<REDACTED-PRIVATE-KEY>"
+                        buffer = buffer[-overlap:]
+                        held, dropping = False, True
+                    continue
+                if dropping:
+                    buffer = buffer[end.end() :]
+                held = dropping = False
+            if len(buffer) < 2 * overlap:
+                continue
+            out, buffer = self._drain(buffer, overlap)
+            if out:
+                yield out
+            held = bool(_KEY_BEGIN_RE.match(buffer)) and not _KEY_END_RE.search(buffer)
+        if buffer and not dropping:
+            yield self.redact(buffer)
+
+
+_default: Redactor | None = None
+
+
+def get_redactor() -> Redactor:
+    global _default
+    if _default is None:
+        _default = Redactor()
+    return _default
 
 
 def redact_text(text: str) -> str:
-    redacted = text
-    redacted = re.sub(r"sk-[A-Za-z0-9]{20,}", "sk-***", redacted)
-    redacted = re.sub(r"(?i)bearer\s+[A-Za-z0-9._-]+", "Bearer ***", redacted)
-    redacted = re.sub(r"eyJ[A-Za-z0-9_-]{10,}\.[A-Za-z0-9._-]+\.[A-Za-z0-9._-]+", "***.***.***", redacted)
-    redacted = re.sub(r"AKIA[0-9A-Z]{16}", "AKIA****************", redacted)
-    redacted = re.sub(r"(?i)aws_secret_access_key\s*[:=]\s*\S+", "aws_secret_access_key=***", redacted)
-    redacted = re.sub(r"(?i)\b([A-Z0-9_]*(PASSWORD|SECRET|TOKEN|API_KEY))\s*[:=]\s*\S+", r"\1=***", redacted)
-    redacted = re.sub(r"-----BEGIN [A-Z ]*PRIVATE KEY-----[\s\S]*?-----END [A-Z ]*PRIVATE KEY-----", "<REDACTED-PRIVATE-KEY>", redacted)
-    return redacted
+    return get_redactor().redact(text)
+
+
+def redact_stream(chunks: Iterable[str], overlap: int = DEFAULT_OVERLAP) -> Iterator[str]:
+    return get_redactor().redact_stream(chunks, overlap)
 
 
+def redact_partial_keys(text: str, starts_inside: bool = False) -> str:
+    # a tail of some output can start inside a private-key block (starts_inside), and output can end
+    # inside one; neither half matches the private_key rule, so both are cut out here
+    if starts_inside:
+        end = _KEY_END_RE.search(text)
+        if end is not None and _KEY_BEGIN_RE.search(text, 0, end.start()) is None:
+            text = "<REDACTED-PRIVATE-KEY>" + text[end.end() :]
+    begins = list(_KEY_BEGIN_RE.finditer(text))
+    if begins and _KEY_END_RE.search(text, begins[-1].end()) is None:
+        text = text[: begins[-1].start()] + "<REDACTED-PRIVATE-KEY>"
+    return text
@@ -0,0 +1,237 @@
+import base64
+import configparser
+import json
+import math
+import os
+import re
+import threading
+import zlib
+from array import array
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+from .constants import RETRIEVAL_INDEX_PATH
+
+# a substituted past command runs with its own arguments, so only near-identical prompts qualify
+DEFAULT_MIN_SCORE = 0.85
+DEFAULT_EXAMPLE_SCORE = 0.5
+NGRAM = 3
+
+# min_score: similarity needed to answer from history when the model is unavailable;
+# local_threshold: if > 0, answer from history before calling the model at all
+# examples: how many similar past (prompt, command) pairs are sent along with a generate request,
+# each at least example_score similar; the model adapts them, so the bar is lower than min_score
+_settings = {"enabled": True, "min_score": DEFAULT_MIN_SCORE, "local_threshold": 0.0, "examples": 0, "example_score": DEFAULT_EXAMPLE_SCORE}
+
+_configured = False
+
+_NON_WORD_RE = re.compile(r"[^a-z0-9]+")
+
+
+def configure_retrieval(config: configparser.ConfigParser) -> None:
+    global _configured
+    _configured = True
+    _settings["enabled"] = config.getboolean("retrieval", "enabled", fallback=True)
+    _settings["min_score"] = config.getfloat("retrieval", "min_score", fallback=DEFAULT_MIN_SCORE)
+    _settings["local_threshold"] = config.getfloat("retrieval", "local_threshold", fallback=0.0)
+    _settings["examples"] = max(0, config.getint("retrieval", "examples", fallback=0))
+    _settings["example_score"] = config.getfloat("retrieval", "example_score", fallback=DEFAULT_EXAMPLE_SCORE)
+
+
+def _config() -> dict:
+    # read on first use: most subcommands never look anything up
+    if not _configured:
+        from .config import loaded_config
+
+        configure_retrieval(loaded_config())
+    return _settings
+
+
+def prompt_grams(prompt: str) -> array:
+    # distinct character trigrams of the normalized prompt, hashed to stable 32-bit ids
+    text = f" {_NON_WORD_RE.sub(' ', prompt.lower()).strip()} "
+    grams = {zlib.crc32(text[i : i + NGRAM].encode("utf-8")) for i in range(len(text) - NGRAM + 1)}
+    return array("I", sorted(grams))
+
+
+class RetrievalIndex:
+    # append-only JSONL on disk, one line per executed (prompt, command) pair with its gram ids;
+    # in memory the gram ids of all documents live in one flat array with an offsets array, and
+    # postings map a gram id to an array of document ids
+    def __init__(self, path: Path = RETRIEVAL_INDEX_PATH):
+        self.path = path
+        self.docs: List[dict] = []
+        self.grams = array("I")
+        self.offsets = array("I", [0])
+        self.postings: Dict[int, array] = {}
+        self.norms = array("d")
+        self._keys: Dict[Tuple[str, str], int] = {}
+        self._pos = 0
+        self._norms_for = 0
+        self._lock = threading.Lock()
+
+    def _add_doc(self, entry: dict, grams: array) -> None:
+        key = (" ".join(entry["prompt"].lower().split()), entry["command"])
+        existing = self._keys.get(key)
+        if existing is not None:
+            doc = self.docs[existing]
+            doc["uses"] = doc.get("uses", 1) + 1
+            doc["ts"] = entry.get("ts")
+            return
+        doc_id = len(self.docs)
+        self._keys[key] = doc_id
+        self.docs.append({"prompt": entry["prompt"], "command": entry["command"], "ts": entry.get("ts"), "uses": 1})
+        self.grams.extend(grams)
+        self.offsets.append(len(self.grams))
+        postings = self.postings
+        for g in grams:
+            try:
+                postings[g].append(doc_id)
+            except KeyError:
+                postings[g] = array("I", (doc_id,))
+
+    def refresh(self) -> None:
+        # reads whatever other processes appended since the last refresh
+        with self._lock:
+            if not self.path.exists():
+                self._build_from_history()
+            try:
+                with open(self.path, "rb") as f:
+                    f.seek(self._pos)
+                    data = f.read()
+            except OSError:
+                return
+            end = data.rfind(b"\n") + 1
+            for line in data[:end].splitlines():
+                try:
+                    entry = json.loads(line)
+                    grams = array("I")
+                    grams.frombytes(base64.b64decode(entry["grams"]))
+                except (ValueError, KeyError, TypeError):
+                    continue
+                self._add_doc(entry, grams)
+            self._pos += end
+
+    def _build_from_history(self) -> None:
+        from .history import tail_history
+
+        lines = [_index_line(r) for r in tail_history() if _indexable(r)]
+        try:
+            fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except OSError:
+            return
+        with os.fdopen(fd, "w") as f:
+            f.write("".join(lines))
+
+    def _idf(self, gram: int) -> float:
+        ids = self.postings.get(gram)
+        return math.log((len(self.docs) + 1) / ((len(ids) if ids else 0) + 1)) + 1.0
+
+    def _refresh_norms(self) -> None:
+        # document norms depend on idf, which drifts as documents are added; recompute lazily
+        if self._norms_for == len(self.docs):
+            return
+        squared = {g: self._idf(g) ** 2 for g in self.postings}
+        grams, offsets = self.grams, self.offsets
+        self.norms = array("d", (math.sqrt(sum(map(squared.__getitem__, grams[offsets[i] : offsets[i + 1]]))) for i in range(len(self.docs))))
+        self._norms_for = len(self.docs)
+
+    def search(self, prompt: str, k: int = 3) -> List[Tuple[float, dict]]:
+        # cosine similarity between idf-weighted binary trigram vectors
+        self.refresh()
+        if not self.docs:
+            return []
+        self._refresh_norms()
+        scores: Dict[int, float] = {}
+        query_norm = 0.0
+        for g in prompt_grams(prompt):
+            weight = self._idf(g)
+            query_norm += weight * weight
+            for doc_id in self.postings.get(g, ()):
+                scores[doc_id] = scores.get(doc_id, 0.0) + weight * weight
+        if not scores:
+            return []
+        query_norm = math.sqrt(query_norm)
+        ranked = sorted(
+            ((dot / (query_norm * self.norms[i]), self.docs[i]["uses"], i) for i, dot in scores.items()),
+            reverse=True,
+        )
+        return [(score, self.docs[i]) for score, _, i in ranked[:k]]
+
+    def append(self, records: Iterable[dict]) -> int:
+        # only appends when the index file exists; otherwise the first refresh builds it from history
+        lines = [_index_line(r) for r in records if _indexable(r)]
+        if not lines or not self.path.exists():
+            return 0
+        try:
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND, 0o600)
+            with os.fdopen(fd, "w") as f:
+                f.write("".join(lines))
+        except OSError:
+            return 0
+        return len(lines)
+
+
+def _indexable(record: dict) -> bool:
+    return bool(record.get("executed") and record.get("prompt") and (record.get("command_raw") or record.get("command")))
+
+
+def _index_line(record: dict) -> str:
+    grams = prompt_grams(record["prompt"])
+    entry = {
+        "prompt": record["prompt"],
+        "command": record.get("command_raw") or record["command"],
+        "ts": record.get("ts"),
+        "grams": base64.b64encode(grams.tobytes()).decode("ascii"),
+    }
+    return json.dumps(entry) + "\n"
+
+
+_index: RetrievalIndex | None = None
+
+
+def get_index() -> RetrievalIndex:
+    global _index
+    if _index is None:
+        _index = RetrievalIndex()
+    return _index
+
+
+def index_history_records(records: List[dict]) -> None:
+    if _config()["enabled"]:
+        get_index().append(records)
+
+
+def lookup_command(prompt: str, min_score: float | None = None) -> Tuple[str, float, str] | None:
+    # (command, similarity, the past prompt it was executed for)
+    settings = _config()
+    if not settings["enabled"]:
+        return None
+    threshold = settings["min_score"] if min_score is None else min_score
+    try:
+        hits = get_index().search(prompt, k=1)
+    except Exception:
+        return None
+    if hits and hits[0][0] >= threshold:
+        return hits[0][1]["command"], hits[0][0], hits[0][1]["prompt"]
+    return None
+
+
+def local_answer(prompt: str) -> Tuple[str, float, str] | None:
+    # the optional fast path; disabled unless [retrieval] local_threshold is set
+    threshold = _config()["local_threshold"]
+    if threshold <= 0:
+        return None
+    return lookup_command(prompt, threshold)
+
+
+def similar_examples(prompt: str) -> List[Tuple[str, str]]:
+    # (prompt, command) pairs above example_score, for the history snippets in a generate request
+    settings = _config()
+    if not settings["enabled"] or not settings["examples"]:
+        return []
+    try:
+        hits = get_index().search(prompt, k=settings["examples"])
+    except Exception:
+        return []
+    return [(doc["prompt"], doc["command"]) for score, doc in hits if score >= settings["example_score"]]
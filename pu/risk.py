@@ -1,36 +1,250 @@
+import configparser
 import re
-from typing import Literal, Tuple, List
-
-
-def analyze_command_risk(command: str) -> Tuple[Literal["low", "medium", "high"], List[str]]:
-    reasons: List[str] = []
-    normalized = "\n".join(
-        line.strip() for line in command.strip().splitlines() if line.strip()
-    )
-    high_patterns: list[tuple[str, str]] = [
-        (r"\brm\s+-rf\s+/(\s|$)", "rm -rf / is catastrophic"),
-        (r"\bdd\b[^\n]*\bof=\s*/dev/sd[a-z]\b", "dd to raw disk device"),
-        (r"\bmkfs\b", "Filesystem formatting (mkfs)"),
-        (r"\b:\(\)\s*\{[^}]*\};\s*:", "Potential fork bomb"),
-        (r"\bchown\s+-R\s+root\s+/\b", "Recursive chown of root"),
-    ]
-    medium_patterns: list[tuple[str, str]] = [
-        (r"\brm\b[^\n]*\*(\s|$)", "rm with wildcard could be destructive"),
-        (r"\bsudo\s+\brm\b", "sudo rm"),
-        (r"curl\b[^\n]*\|\s*(sh|bash)", "Piping remote script to shell"),
-        (r">\s*/etc/", "Redirect writing into /etc"),
-        (r">\s*/var/", "Redirect writing into /var"),
-    ]
-    for pattern, msg in high_patterns:
-        if re.search(pattern, normalized):
-            reasons.append(msg)
-    if reasons:
-        return "high", reasons
-    for pattern, msg in medium_patterns:
-        if re.search(pattern, normalized):
-            reasons.append(msg)
-    if reasons:
-        return "medium", reasons
-    return "low", []
+import sys
+from functools import lru_cache
+from typing import Dict, Iterable, List, Literal, Tuple
 
+from .shellparse import ParsedCommand, SimpleCommand, parse_command, strip_prefixes
 
+RiskLevel = Literal["low", "medium", "high"]
+# (level, pattern, message); evaluated on the normalized command text
+Rule = Tuple[str, str, str]
+
+TEXT_RULES: List[Rule] = [
+    ("high", r"\brm\s+-rf\s+/(\s|$)", "rm -rf / is catastrophic"),
+    ("high", r"\bdd\b[^\n]*\bof=\s*/dev/sd[a-z]\b", "dd to raw disk device"),
+    ("high", r"\bmkfs\b", "Filesystem formatting (mkfs)"),
+    ("high", r":\(\)\s*\{[^}]*\};\s*:", "Potential fork bomb"),
+    ("high", r"\bchown\s+-R\s+root\s+/\b", "Recursive chown of root"),
+    ("medium", r"\brm\b[^\n]*\*(\s|$)", "rm with wildcard could be destructive"),
+    ("medium", r"\bsudo\s+\brm\b", "sudo rm"),
+    ("medium", r"curl\b[^\n]*\|\s*(sh|bash)", "Piping remote script to shell"),
+    ("medium", r">\s*/etc/", "Redirect writing into /etc"),
+    ("medium", r">\s*/var/", "Redirect writing into /var"),
+]
+
+# cheap gate for the token-level analysis; commands without any of these cannot trip a token rule.
+# Quotes, escapes and expansions can spell a program name the raw text does not show (r'm', \rm,
+# ${x}m), so text containing any of them is always analysed.
+_TOKEN_TRIGGER_RE = re.compile(r"\b(?:rm|dd|mkfs[\w.]*|chown|curl|wget|tee)\b|[>'\"\\$`]")
+_ASSIGNMENT_RE = re.compile(r"^([A-Za-z_][A-Za-z0-9_]*)=(.*)$", re.DOTALL)
+_VARIABLE_RE = re.compile(r"\$\{([A-Za-z_][A-Za-z0-9_]*)\}|\$([A-Za-z_][A-Za-z0-9_]*)")
+_RAW_DISK_RE = re.compile(r"^of=/dev/(?:sd[a-z]|hd[a-z]|vd[a-z]|xvd[a-z]|nvme\d|mmcblk\d|disk\d)")
+_SHELLS = {"sh", "bash", "zsh", "dash", "ksh"}
+# heredocs fed to a shell (directly or further down the pipeline) are scripts; other heredocs are data,
+# from which only high-level findings are kept. Nested heredocs are followed this many levels deep.
+MAX_SCRIPT_DEPTH = 2
+_ROOT_TARGETS = {"/", "/*", "/.", "//"}
+_GLOBAL_FLAGS_RE = re.compile(r"^\(\?([aiLmsux]+)\)")
+
+_user_rules: List[Rule] = []
+_engine: "RiskEngine | None" = None
+_configured = False
+
+
+def configure_risk(config: configparser.ConfigParser) -> None:
+    # [risk] entries look like: name = high | regex | message
+    global _engine, _configured
+    _configured = True
+    _user_rules.clear()
+    if config.has_section("risk"):
+        for name, value in config.items("risk"):
+            parts = [p.strip() for p in value.split("|", 2)]
+            if len(parts) < 2 or parts[0] not in ("high", "medium"):
+                continue
+            rule = (parts[0], _scope_flags(parts[1]), parts[2] if len(parts) > 2 and parts[2] else name)
+            # checked as part of the combined pattern too: duplicate group names only fail there
+            try:
+                re.compile(rule[1])
+                re.compile(_combine(TEXT_RULES + _user_rules + [rule]))
+            except re.error as e:
+                print(f"⚠️ Ignoring invalid risk rule '{name}': {e}", file=sys.stderr)
+                continue
+            _user_rules.append(rule)
+    _engine = None
+
+
+def _scope_flags(pattern: str) -> str:
+    # leading global flags such as (?i) are only valid at the start of the whole expression,
+    # so they become a scoped group that keeps their meaning inside the combined alternation
+    m = _GLOBAL_FLAGS_RE.match(pattern)
+    return f"(?{m.group(1)}:{pattern[m.end():]})" if m else pattern
+
+
+def _combine(rules: List[Rule]) -> str:
+    return "|".join(f"(?:{pattern})" for _, pattern, _ in rules)
+
+
+def _normalize(command: str) -> str:
+    return "\n".join(line.strip() for line in command.strip().splitlines() if line.strip())
+
+
+def _expand(word: str, variables: Dict[str, str]) -> str:
+    if "$" not in word:
+        return word
+    return _VARIABLE_RE.sub(lambda m: variables.get(m.group(1) or m.group(2), m.group(0)), word)
+
+
+def _split_flags(args: List[str]) -> Tuple[set, List[str]]:
+    flags: set = set()
+    targets: List[str] = []
+    only_targets = False
+    for arg in args:
+        if only_targets or not arg.startswith("-") or arg == "-":
+            targets.append(arg)
+        elif arg == "--":
+            only_targets = True
+        elif arg.startswith("--"):
+            flags.add(arg)
+        else:
+            flags.update(arg[1:])
+    return flags, targets
+
+
+@lru_cache(maxsize=2048)
+def _token_findings(source: str) -> Tuple[Tuple[str, str], ...]:
+    # pure function of the command text, so repeated commands (history audits, batches) hit the cache;
+    # parse_command is cached as well, so the parse is the one dry-run and review already use
+    findings: List[Tuple[str, str]] = []
+    _scan(parse_command(source), {}, findings, 0)
+    return tuple(findings)
+
+
+def _program(words: List[str]) -> str:
+    # basename of the program a simple command runs, past assignments and sudo/env/... prefixes
+    i = 0
+    while i < len(words) and _ASSIGNMENT_RE.match(words[i]):
+        i += 1
+    words, _ = strip_prefixes(words[i:])
+    return words[0].rsplit("/", 1)[-1] if words else ""
+
+
+def _feeds_shell(commands: List[SimpleCommand], i: int) -> bool:
+    # True if a later command in the same pipeline is a shell (cat <<EOF | sudo bash)
+    for command in commands[i + 1 :]:
+        if not command.piped:
+            return False
+        if _program(command.words) in _SHELLS:
+            return True
+    return False
+
+
+def _scan(parsed: ParsedCommand, variables: Dict[str, str], findings: List[Tuple[str, str]], depth: int) -> None:
+    for statement in parsed.statements:
+        previous_cmd = ""
+        for index, command in enumerate(statement.commands):
+            if command.header:
+                continue
+            words = command.words
+            while words and _ASSIGNMENT_RE.match(words[0]):
+                name, value = _ASSIGNMENT_RE.match(words[0]).groups()
+                variables[name] = _expand(value, variables)
+                words = words[1:]
+            if words[:1] == ["export"]:
+                for word in words[1:]:
+                    m = _ASSIGNMENT_RE.match(word)
+                    if m:
+                        variables[m.group(1)] = _expand(m.group(2), variables)
+                words = []
+            words = [_expand(w, variables) for w in words]
+            redirects = [_expand(r, variables) for r in command.output_targets]
+            words, elevated = strip_prefixes(words)
+            cmd = words[0].rsplit("/", 1)[-1] if words else ""
+            flags, targets = _split_flags(words[1:])
+            if cmd == "rm":
+                recursive = bool({"r", "R", "--recursive"} & flags)
+                if recursive and any(t in _ROOT_TARGETS for t in targets):
+                    findings.append(("high", "rm -rf / is catastrophic"))
+                if any("*" in t for t in targets):
+                    findings.append(("medium", "rm with wildcard could be destructive"))
+                if elevated:
+                    findings.append(("medium", "sudo rm"))
+            elif cmd == "dd" and any(_RAW_DISK_RE.match(t) for t in targets):
+                findings.append(("high", "dd to raw disk device"))
+            elif cmd.startswith("mkfs"):
+                findings.append(("high", "Filesystem formatting (mkfs)"))
+            elif cmd == "chown" and bool({"R", "--recursive"} & flags) and "/" in targets[1:]:
+                findings.append(("high", "Recursive chown of root"))
+            elif cmd == "tee":
+                redirects = redirects + targets
+            elif cmd in _SHELLS and command.piped and previous_cmd in ("curl", "wget"):
+                findings.append(("medium", "Piping remote script to shell"))
+            if command.heredocs and depth < MAX_SCRIPT_DEPTH:
+                script = cmd in _SHELLS or _feeds_shell(statement.commands, index)
+                for body in command.heredocs:
+                    if script:
+                        _scan(parse_command(body), variables, findings, depth + 1)
+                    else:
+                        # data that may still be run later (cat > x.sh <<EOF ... bash x.sh): keep only what is high
+                        data: List[Tuple[str, str]] = []
+                        _scan(parse_command(body), dict(variables), data, depth + 1)
+                        findings.extend(f for f in data if f[0] == "high")
+            for target in redirects:
+                if target.startswith("/etc/"):
+                    findings.append(("medium", "Redirect writing into /etc"))
+                elif target.startswith("/var/"):
+                    findings.append(("medium", "Redirect writing into /var"))
+            previous_cmd = cmd
+
+
+class RiskEngine:
+    # all text rules are compiled once into a single alternation, which finds the positions where
+    # some rule matches; every rule is then tried at those positions, so rules sharing a start are all seen
+    def __init__(self, rules: List[Rule]):
+        self.rules = rules
+        self.combined = re.compile(_combine(rules))
+        self.compiled = [re.compile(pattern) for _, pattern, _ in rules]
+
+    def _text_hits(self, text: str, start: int = 0, end: int | None = None) -> Iterable[Tuple[int, int]]:
+        # yields (position, rule index); searching resumes one char after each hit so overlapping rules are seen
+        end = len(text) if end is None else end
+        pos = start
+        while pos < end:
+            m = self.combined.search(text, pos, end)
+            if not m:
+                return
+            for i, rule in enumerate(self.compiled):
+                if rule.match(text, m.start(), end):
+                    yield m.start(), i
+            pos = m.start() + 1
+
+    def _verdict(self, source: str, text: str, hit_rules: Iterable[int]) -> Tuple[RiskLevel, List[str]]:
+        # text rules see the normalized text; the token rules walk the parse of the original source
+        findings = [(self.rules[i][0], self.rules[i][2]) for i in sorted(set(hit_rules))]
+        if _TOKEN_TRIGGER_RE.search(text):
+            findings.extend(_token_findings(source))
+        for level in ("high", "medium"):
+            reasons = list(dict.fromkeys(msg for lvl, msg in findings if lvl == level))
+            if reasons:
+                return level, reasons
+        return "low", []
+
+    def score(self, command: "str | ParsedCommand") -> Tuple[RiskLevel, List[str]]:
+        source = command.source if isinstance(command, ParsedCommand) else command
+        text = _normalize(source)
+        return self._verdict(source, text, (i for _, i in self._text_hits(text)))
+
+    def score_many(self, commands: Iterable[str]) -> List[Tuple[RiskLevel, List[str]]]:
+        # each command is searched on its own: user rules may anchor with ^ and $, which a single pass
+        # over all commands joined together would only honour for the first and last of them
+        return [self.score(command) for command in commands]
+
+
+def get_engine() -> RiskEngine:
+    global _engine
+    if not _configured:
+        # read on first use: most subcommands never score a command
+        from .config import loaded_config
+
+        configure_risk(loaded_config())
+    if _engine is None:
+        _engine = RiskEngine(TEXT_RULES + _user_rules)
+    return _engine
+
+
+def analyze_command_risk(command: "str | ParsedCommand") -> Tuple[RiskLevel, List[str]]:
+    return get_engine().score(command)
+
+
+def score_many(commands: Iterable[str]) -> List[Tuple[RiskLevel, List[str]]]:
+    return get_engine().score_many(commands)
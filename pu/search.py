@@ -0,0 +1,353 @@
+import json
+import math
+import os
+import re
+import sqlite3
+from bisect import bisect_left
+from collections import Counter
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+from .constants import HISTORY_JSONL_PATH, SEARCH_INDEX_PATH
+
+# inverted index over history prompt + command tokens, kept in its own SQLite file and brought up
+# to date on every search by indexing only what was appended since the last one
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    id INTEGER PRIMARY KEY,
+    ts TEXT,
+    cwd TEXT,
+    risk TEXT,
+    provider TEXT,
+    executed INTEGER,
+    length INTEGER NOT NULL,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_docs_ts ON docs(ts);
+CREATE TABLE IF NOT EXISTS terms (term TEXT PRIMARY KEY, df INTEGER NOT NULL) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT NOT NULL,
+    doc INTEGER NOT NULL,
+    tf INTEGER NOT NULL,
+    PRIMARY KEY (term, doc)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+# weight of a query term matched exactly, as a prefix of a longer token, or within the edit distance
+EXACT_WEIGHT = 1.0
+PREFIX_WEIGHT = 0.7
+TYPO_WEIGHT = 0.5
+MAX_PREFIX_EXPANSIONS = 20
+MAX_BOUND_IDS = 500
+
+FILTER_KEYS = ("cwd", "risk", "provider", "executed", "since", "until")
+
+_TOKEN_RE = re.compile(r"[a-z0-9_]+")
+_FILTER_RE = re.compile(r"^(?P<key>[a-z]+):(?P<value>.+)$")
+_RELATIVE_RE = re.compile(r"^(\d+)([hdw])$")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+def _within_distance(a: str, b: str, limit: int) -> bool:
+    # optimal string alignment distance (adjacent swaps count as one edit), abandoned once every
+    # cell of a row exceeds the limit
+    if abs(len(a) - len(b)) > limit:
+        return False
+    previous2: List[int] = []
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return False
+        previous2, previous = previous, current
+    return previous[-1] <= limit
+
+
+def parse_time_bound(value: str, end: bool = False) -> str | None:
+    # ISO dates/times, today/yesterday, or relative ages like 12h, 7d, 2w; returns an ISO bound
+    now = datetime.now()
+    value = value.lower()
+    m = _RELATIVE_RE.match(value)
+    if m:
+        unit = {"h": "hours", "d": "days", "w": "weeks"}[m.group(2)]
+        return (now - timedelta(**{unit: int(m.group(1))})).isoformat()
+    if value in ("today", "yesterday"):
+        day = now.replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=1 if value == "yesterday" else 0)
+    else:
+        try:
+            day = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+        if len(value) > 10:
+            return day.isoformat()
+    # a bare date as an upper bound includes that whole day
+    return (day + timedelta(days=1) if end else day).isoformat()
+
+
+def parse_query(query: str) -> Tuple[List[str], List[str], List[object]]:
+    # returns (terms, SQL conditions on docs d, parameters)
+    terms: List[str] = []
+    where: List[str] = []
+    params: List[object] = []
+    for word in query.split():
+        m = _FILTER_RE.match(word)
+        key, value = (m.group("key"), m.group("value").strip('"')) if m else (None, None)
+        if key not in FILTER_KEYS:
+            terms.extend(tokenize(word))
+            continue
+        if key == "cwd":
+            path = os.getcwd() if value == "." else os.path.abspath(os.path.expanduser(value))
+            where.append("(d.cwd = ? OR d.cwd LIKE ? ESCAPE '\\')")
+            escaped = path.rstrip("/").replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            params.extend([path, escaped + "/%"])
+        elif key in ("risk", "provider"):
+            values = [v for v in value.lower().split(",") if v]
+            where.append(f"d.{key} IN ({', '.join('?' for _ in values)})")
+            params.extend(values)
+        elif key == "executed":
+            where.append("d.executed = ?")
+            params.append(1 if value.lower() in ("1", "y", "yes", "true") else 0)
+        else:
+            bound = parse_time_bound(value, end=key == "until")
+            if bound is None:
+                terms.extend(tokenize(word))
+                continue
+            where.append("d.ts >= ?" if key == "since" else "d.ts < ?")
+            params.append(bound)
+    return terms, where, params
+
+
+class HistorySearch:
+    def __init__(self, path: Path = SEARCH_INDEX_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(str(path))
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        if os.stat(path).st_mode & 0o077:
+            os.chmod(path, 0o600)
+
+    def _meta(self) -> Dict[str, object]:
+        return {k: json.loads(v) for k, v in self.conn.execute("SELECT key, value FROM meta")}
+
+    def _set_meta(self, **values: object) -> None:
+        self.conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", [(k, json.dumps(v)) for k, v in values.items()])
+
+    def _clear(self) -> None:
+        for table in ("docs", "terms", "postings", "meta"):
+            self.conn.execute(f"DELETE FROM {table}")
+
+    def _index(self, records: Iterable[dict], ids: Iterable[int] | None = None) -> int:
+        # ids, when given, are the history row ids (sqlite backend); JSONL docs are numbered in order.
+        # Annotation records are merged into the doc they name, whether it is in this batch or indexed before.
+        from .history import _annotation_fields, _record_key
+
+        docs, postings = [], []
+        df: Counter = Counter()
+        next_id = (self.conn.execute("SELECT max(id) FROM docs").fetchone()[0] or 0) + 1
+        id_iter = iter(ids) if ids is not None else None
+        batch: Dict[tuple, dict] = {}
+        for record in records:
+            note = _annotation_fields(record)
+            if note is not None:
+                if note[0] in batch:
+                    batch[note[0]].update(note[1])
+                else:
+                    self._annotate(note[0], note[1])
+                continue
+            if id_iter is not None:
+                next_id = next(id_iter)
+            record = dict(record)
+            batch[_record_key(record)] = record
+            tokens = tokenize(f"{record.get('prompt') or ''} {record.get('command') or ''}")
+            counts = Counter(tokens)
+            executed = record.get("executed")
+            docs.append(
+                (
+                    next_id,
+                    record.get("ts"),
+                    record.get("cwd"),
+                    record.get("risk"),
+                    record.get("provider"),
+                    None if executed is None else int(bool(executed)),
+                    len(tokens),
+                    record,
+                )
+            )
+            postings.extend((term, next_id, tf) for term, tf in counts.items())
+            df.update(counts.keys())
+            next_id += 1
+        if not docs:
+            return 0
+        self.conn.executemany(
+            "INSERT INTO docs (id, ts, cwd, risk, provider, executed, length, record) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [doc[:-1] + (json.dumps(doc[-1]),) for doc in docs],
+        )
+        self.conn.executemany("INSERT INTO postings (term, doc, tf) VALUES (?, ?, ?)", postings)
+        self.conn.executemany(
+            "INSERT INTO terms (term, df) VALUES (?, ?) ON CONFLICT(term) DO UPDATE SET df = df + excluded.df",
+            df.items(),
+        )
+        return len(docs)
+
+    def _annotate(self, key: tuple, fields: dict) -> None:
+        # the newest doc with this ts and raw command; annotations only name records of their own segment
+        for doc, record in self.conn.execute("SELECT id, record FROM docs WHERE ts IS ? ORDER BY id DESC", (key[0],)).fetchall():
+            record = json.loads(record)
+            if record.get("command_raw") == key[1]:
+                self.conn.execute("UPDATE docs SET record = ? WHERE id = ?", (json.dumps({**record, **fields}), doc))
+                return
+
+    def _sync_jsonl(self, meta: Dict[str, object]) -> None:
+        from .history import _iter_archive, _parse_history_line, history_archives
+
+        archives = history_archives()
+        try:
+            st = HISTORY_JSONL_PATH.stat()
+            inode, size = st.st_ino, st.st_size
+        except OSError:
+            inode, size = 0, 0
+        offset = meta.get("offset", 0)
+        # rotation or pruning changes the archive list and starts a new live file: re-index everything
+        if meta.get("source") != "jsonl" or meta.get("archives") != [a.name for a in archives] or meta.get("inode") != inode or size < offset:
+            self._clear()
+            for archive in archives:
+                self._index(_iter_archive(archive))
+            offset = 0
+        if size > offset:
+            with open(HISTORY_JSONL_PATH, "rb") as f:
+                f.seek(offset)
+                data = f.read(size - offset)
+            end = data.rfind(b"\n") + 1
+            lines = data[:end].decode("utf-8", errors="replace").splitlines()
+            self._index(r for r in map(_parse_history_line, lines) if r is not None)
+            offset += end
+        self._set_meta(source="jsonl", archives=[a.name for a in archives], inode=inode, offset=offset)
+
+    def _sync_sqlite(self, meta: Dict[str, object]) -> None:
+        from .history_db import rows_after
+
+        if meta.get("source") != "sqlite":
+            self._clear()
+            meta = {}
+        rows = rows_after(meta.get("last_id", 0))
+        self._index((record for _, record in rows), [row_id for row_id, _ in rows])
+        self._set_meta(source="sqlite", last_id=rows[-1][0] if rows else meta.get("last_id", 0))
+
+    def sync(self) -> None:
+        from .history import _settings as history_settings
+
+        # IMMEDIATE takes the write lock up front so concurrent searches do not index the same tail twice
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            meta = self._meta()
+            if history_settings["backend"] == "sqlite":
+                self._sync_sqlite(meta)
+            else:
+                self._sync_jsonl(meta)
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def _expand(self, term: str, vocab: List[str], df: Dict[str, int]) -> List[Tuple[str, float]]:
+        expansions: Dict[str, float] = {}
+        if term in df:
+            expansions[term] = EXACT_WEIGHT
+        if len(term) >= 2:
+            start = bisect_left(vocab, term)
+            longer = []
+            for candidate in vocab[start:]:
+                if not candidate.startswith(term):
+                    break
+                if candidate != term:
+                    longer.append(candidate)
+            for candidate in sorted(longer, key=df.__getitem__, reverse=True)[:MAX_PREFIX_EXPANSIONS]:
+                expansions[candidate] = PREFIX_WEIGHT
+        # typo tolerance only kicks in for words that do not occur as typed; numbers are never fuzzed
+        if term not in df and len(term) >= 4 and not any(c.isdigit() for c in term):
+            limit = 1 if len(term) <= 6 else 2
+            for candidate in vocab:
+                if candidate not in expansions and _within_distance(term, candidate, limit):
+                    expansions[candidate] = TYPO_WEIGHT
+        return list(expansions.items())
+
+    def search(self, query: str, limit: int | None = 20) -> List[dict]:
+        # ranked best-first when the query has terms; filter-only queries return the newest matches
+        # in chronological order, like tail_history
+        self.sync()
+        terms, where, params = parse_query(query)
+        filters = "".join(f" AND {w}" for w in where)
+        if not terms:
+            sql = f"SELECT d.id FROM docs d WHERE 1{filters} ORDER BY d.id DESC"
+            ids = [r[0] for r in self.conn.execute(sql + (" LIMIT ?" if limit else ""), params + ([limit] if limit else []))]
+            return self._records(ids[::-1])
+
+        n_docs, total_length = self.conn.execute("SELECT count(*), coalesce(sum(length), 0) FROM docs").fetchone()
+        if not n_docs:
+            return []
+        avg_length = total_length / n_docs or 1.0
+        df = dict(self.conn.execute("SELECT term, df FROM terms"))
+        vocab = sorted(df)
+        scores: Dict[int, float] = {}
+        coverage: Counter = Counter()
+        for term in dict.fromkeys(terms):
+            best: Dict[int, float] = {}
+            for candidate, weight in self._expand(term, vocab, df):
+                idf = math.log(1 + (n_docs - df[candidate] + 0.5) / (df[candidate] + 0.5))
+                sql = f"SELECT p.doc, p.tf, d.length FROM postings p JOIN docs d ON d.id = p.doc WHERE p.term = ?{filters}"
+                for doc, tf, length in self.conn.execute(sql, [candidate] + params):
+                    score = weight * idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length))
+                    if score > best.get(doc, 0.0):
+                        best[doc] = score
+            for doc, score in best.items():
+                scores[doc] = scores.get(doc, 0.0) + score
+                coverage[doc] += 1
+        # documents matching more of the query terms always outrank partial matches
+        ranked = sorted(scores, key=lambda doc: (coverage[doc], scores[doc], doc), reverse=True)[: limit or None]
+        if not ranked:
+            return []
+        return self._records(ranked)
+
+    def _records(self, ids: List[int]) -> List[dict]:
+        # with the sqlite backend docs share the history row id and the row is read fresh, so annotations
+        # made after indexing (explanations, exit codes) show; JSONL docs have them merged in by _index
+        from .history import _settings as history_settings
+
+        sqlite = history_settings["backend"] == "sqlite"
+        if sqlite:
+            from .history_db import by_ids
+        records: Dict[int, dict] = {}
+        # in chunks: older SQLite builds allow only 999 bound variables per statement
+        for i in range(0, len(ids), MAX_BOUND_IDS):
+            chunk = ids[i : i + MAX_BOUND_IDS]
+            if sqlite:
+                records.update(by_ids(chunk))
+            else:
+                sql = f"SELECT id, record FROM docs WHERE id IN ({', '.join('?' for _ in chunk)})"
+                records.update((doc, json.loads(record)) for doc, record in self.conn.execute(sql, chunk))
+        return [records[doc] for doc in ids if doc in records]
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+def search_history(query: str, limit: int | None = 20) -> List[dict]:
+    index = HistorySearch()
+    try:
+        return index.search(query, limit)
+    finally:
+        index.close()
@@ -0,0 +1,280 @@
+import re
+from functools import lru_cache
+from typing import Iterator, List, Tuple
+
+# One parse of a generated command, shared by pu.risk, pu.dryrun and pu.commands.
+#
+# The text is split into statements: what a user reviews and runs as a unit. A statement is one
+# logical line plus everything the shell would read with it: backslash continuations, quotes that
+# span lines, lines ending in | && ||, heredoc bodies, and compound commands (if/fi, for/done,
+# case/esac, { }, subshells) that are still open. Each statement is a sequence of simple commands
+# with their words, redirections, heredoc bodies and the operator that connects them to the previous one.
+
+# each match is one token with the whitespace before it; findall returns (op, comment, word)
+_TOKEN_RE = re.compile(
+    r"""\s*(?:(\|\||&&|;;|\|&|&>>|&>|>>|>\||<<<|<<-|<<|[0-9]?>&|[0-9]?>|<&|[|;&()<])"""
+    r"""|(\#.*)"""
+    r"""|((?:[^\s'"\\|;&()<>]|\\.|'[^']*'|"(?:[^"\\]|\\.)*")+))"""
+)
+_QUOTING_RE = re.compile(r"""['"\\]""")
+_QUOTED_RE = re.compile(r"""'([^']*)'|"((?:[^"\\]|\\.)*)"|\\(.)""", re.DOTALL)
+_CONTINUATION_RE = re.compile(r"(?<!\\)(?:\\\\)*\\$")
+
+SEPARATORS = {"|", "||", "&&", ";", "&", "(", ")", "|&", ";;"}
+OUTPUT_REDIRECTS = {">", ">>", "&>", "&>>", ">|"} | {f"{fd}>" for fd in range(10)}
+# the target of these is a file descriptor or an input, never a file that gets written
+OTHER_REDIRECTS = {"<", "<&", "<<<", ">&"} | {f"{fd}>&" for fd in range(10)}
+HEREDOCS = {"<<", "<<-"}
+# a line ending in one of these continues on the next line
+_OPEN_OPERATORS = {"|", "||", "&&", "|&"}
+
+# reserved words that may precede a command in the same simple command (then rm ..., do rm ...)
+_LEADING_KEYWORDS = {"if", "then", "else", "elif", "do", "while", "until", "!", "{"}
+# reserved words whose simple command is a header (for x in ...), not something that runs
+_HEADER_KEYWORDS = {"for", "select", "case"}
+_OPENERS = {"if": "fi", "for": "done", "select": "done", "while": "done", "until": "done", "case": "esac", "{": "}"}
+_CLOSERS = {"fi", "done", "esac", "}"}
+
+# wrappers that run the command given in their arguments
+PREFIX_COMMANDS = {"sudo", "doas", "env", "command", "builtin", "exec", "nohup", "time", "nice", "xargs"}
+ELEVATING = {"sudo", "doas"}
+_ASSIGNMENT_RE = re.compile(r"^([A-Za-z_][A-Za-z0-9_]*)=(.*)$", re.DOTALL)
+
+# a quote still open after this many lines is treated as unparseable rather than read to the end
+MAX_QUOTED_LINES = 200
+
+
+def unquote(word: str) -> str:
+    if "'" not in word and '"' not in word and "\\" not in word:
+        return word
+    return _QUOTED_RE.sub(lambda m: m.group(1) if m.group(1) is not None else (m.group(2) if m.group(2) is not None else m.group(3)), word)
+
+
+def strip_prefixes(words: List[str]) -> Tuple[List[str], bool]:
+    # drops sudo/env/nice/... with their options and assignments; True if one of them elevates
+    elevated = False
+    i = 0
+    while i < len(words):
+        word = words[i]
+        if word in PREFIX_COMMANDS:
+            elevated = elevated or word in ELEVATING
+            i += 1
+            while i < len(words) and (words[i].startswith("-") or _ASSIGNMENT_RE.match(words[i])):
+                i += 1
+            continue
+        break
+    return words[i:], elevated
+
+
+class SimpleCommand:
+    __slots__ = ("connector", "keywords", "raw_words", "words", "redirects", "heredocs", "header")
+
+    def __init__(self, connector: str | None):
+        # operator joining this command to the previous one in its statement (None for the first)
+        self.connector = connector
+        self.keywords: List[str] = []
+        self.raw_words: List[str] = []
+        self.words: List[str] = []
+        # (operator, unquoted target); heredoc bodies are in `heredocs`, in order
+        self.redirects: List[Tuple[str, str]] = []
+        self.heredocs: List[str] = []
+        self.header = False
+
+    @property
+    def piped(self) -> bool:
+        return self.connector in ("|", "|&")
+
+    @property
+    def name(self) -> str:
+        # basename of the program, "" for assignments-only, headers and empty commands
+        if self.header or not self.words:
+            return ""
+        return self.words[0].rsplit("/", 1)[-1]
+
+    @property
+    def output_targets(self) -> List[str]:
+        return [target for op, target in self.redirects if op in OUTPUT_REDIRECTS]
+
+    def __repr__(self) -> str:
+        return f"SimpleCommand({self.connector!r}, {self.words!r}, redirects={self.redirects!r})"
+
+
+class Statement:
+    def __init__(self, text: str, line: int):
+        # original source, continuations and heredoc bodies included, so it can be run as is
+        self.text = text
+        self.line = line
+        self.commands: List[SimpleCommand] = []
+        # False when quoting could not be balanced; commands is then empty
+        self.parsed = True
+
+    def one_line(self) -> str:
+        return " ".join(self.text.replace("\\\n", " ").split())
+
+
+class ParsedCommand:
+    def __init__(self, source: str, statements: List[Statement]):
+        self.source = source
+        self.statements = statements
+
+    def commands(self) -> Iterator[SimpleCommand]:
+        for statement in self.statements:
+            yield from statement.commands
+
+
+def _tokenize(text: str) -> List[Tuple[str, str]] | None:
+    # (kind, raw) pairs for ops and words; None if a quote is left open. Every character outside
+    # quotes and escapes starts some token, so only text with quoting needs the position check.
+    if _QUOTING_RE.search(text) is not None:
+        pos = 0
+        for m in _TOKEN_RE.finditer(text):
+            if m.start() != pos:
+                return None
+            pos = m.end()
+        if text[pos:].strip():
+            return None
+    tokens: List[Tuple[str, str]] = []
+    for op, comment, word in _TOKEN_RE.findall(text):
+        if comment:
+            break
+        tokens.append(("op", op) if op else ("word", word))
+    return tokens
+
+
+class _Builder:
+    # turns the token stream of one statement into simple commands, tracking compound-command depth
+    def __init__(self, statement: Statement):
+        self.statement = statement
+        self.current = SimpleCommand(None)
+        self.expect: str | None = None
+        self.open: List[str] = []
+        # heredoc bodies still to be read after the current line: (command, delimiter, strip_tabs)
+        self.pending: List[Tuple[SimpleCommand, str, bool]] = []
+        self.last = ""
+
+    def _finish(self, connector: str) -> None:
+        current = self.current
+        if current.words or current.redirects or current.keywords or any(c is current for c, _, _ in self.pending):
+            self.statement.commands.append(current)
+            self.current = SimpleCommand(connector)
+        else:
+            current.connector = connector
+
+    def feed(self, tokens: List[Tuple[str, str]]) -> None:
+        for kind, raw in tokens:
+            self.last = raw if kind == "op" else ""
+            current = self.current
+            if self.expect is not None:
+                if self.expect in HEREDOCS:
+                    self.pending.append((current, unquote(raw), self.expect == "<<-"))
+                else:
+                    current.redirects.append((self.expect, unquote(raw)))
+                self.expect = None
+            elif kind == "op" and (raw in OUTPUT_REDIRECTS or raw in OTHER_REDIRECTS or raw in HEREDOCS):
+                self.expect = raw
+            elif kind == "op":
+                if raw == "(":
+                    self.open.append(")")
+                elif raw == ")" and self.open and self.open[-1] == ")":
+                    self.open.pop()
+                self._finish(raw)
+            elif not current.words and not current.header:
+                self._word(current, raw)
+            else:
+                current.raw_words.append(raw)
+                current.words.append(unquote(raw))
+
+    def _word(self, current: SimpleCommand, raw: str) -> None:
+        # a word in command position: reserved words open or close compound commands
+        if raw in _CLOSERS:
+            if raw in self.open:
+                while self.open and self.open.pop() != raw:
+                    pass
+            current.keywords.append(raw)
+            return
+        if raw in _OPENERS:
+            self.open.append(_OPENERS[raw])
+        if raw in _LEADING_KEYWORDS:
+            current.keywords.append(raw)
+            return
+        if raw in _HEADER_KEYWORDS:
+            current.keywords.append(raw)
+            current.header = True
+            return
+        current.raw_words.append(raw)
+        current.words.append(unquote(raw))
+
+    def end_line(self) -> None:
+        # a newline separates commands unless the line ended in an operator that carries on
+        if self.last not in _OPEN_OPERATORS:
+            self._finish(";")
+
+    @property
+    def complete(self) -> bool:
+        return not self.open and self.last not in _OPEN_OPERATORS and self.expect is None
+
+    def close(self) -> None:
+        self._finish(";")
+
+
+def _read_heredoc(lines: List[str], i: int, delimiter: str, strip_tabs: bool) -> Tuple[str, int]:
+    # body lines up to the delimiter line; an unterminated heredoc runs to the end of the text
+    body: List[str] = []
+    while i < len(lines):
+        line = lines[i]
+        i += 1
+        if (line.lstrip("\t") if strip_tabs else line) == delimiter:
+            break
+        body.append(line)
+    return "\n".join(body), i
+
+
+@lru_cache(maxsize=256)
+def parse_command(source: str) -> ParsedCommand:
+    # linear in the length of the text; cached so each stage that asks for the same text shares one parse
+    lines = source.strip("\n").split("\n")
+    statements: List[Statement] = []
+    i = 0
+    while i < len(lines):
+        if not lines[i].strip():
+            i += 1
+            continue
+        start = i
+        statement = Statement("", start + 1)
+        builder = _Builder(statement)
+        while i < len(lines):
+            # one logical line: backslash-newline pairs removed, lines inside open quotes joined
+            logical = ""
+            quoted_lines = 0
+            tokens = None
+            while i < len(lines):
+                line = lines[i]
+                i += 1
+                if line.endswith("\\") and _CONTINUATION_RE.search(line):
+                    logical += line[:-1]
+                    if i < len(lines):
+                        continue
+                else:
+                    logical += line
+                tokens = _tokenize(logical)
+                if tokens is not None or i >= len(lines) or quoted_lines >= MAX_QUOTED_LINES:
+                    break
+                logical += "\n"
+                quoted_lines += 1
+            if tokens is None:
+                statement.parsed = False
+                break
+            builder.feed(tokens)
+            for command, delimiter, strip_tabs in builder.pending:
+                body, i = _read_heredoc(lines, i, delimiter, strip_tabs)
+                command.heredocs.append(body)
+            builder.pending = []
+            builder.end_line()
+            if builder.complete:
+                break
+        builder.close()
+        if not statement.parsed:
+            statement.commands = []
+        statement.text = "\n".join(lines[start:i]).strip()
+        statements.append(statement)
+    return ParsedCommand(source, statements)
@@ -0,0 +1,62 @@
+import builtins
+import sys
+import time
+from typing import List, Tuple
+
+# A small in-process equivalent of `python -X importtime`: wraps __import__ and
+# records self/cumulative time for every module imported for the first time.
+
+_original_import = builtins.__import__
+_records: List[Tuple[str, float, float]] = []
+_stack: List[List[float]] = []
+_started: float | None = None
+
+
+def _resolve_name(name: str, globals, level: int) -> str:
+    if level == 0:
+        return name
+    package = (globals or {}).get("__package__") or ""
+    base = package.rsplit(".", level - 1)[0] if level > 1 else package
+    return f"{base}.{name}" if name else base
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    fullname = _resolve_name(name, globals, level)
+    if fullname in sys.modules:
+        return _original_import(name, globals, locals, fromlist, level)
+    _stack.append([0.0])
+    start = time.perf_counter()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        elapsed = time.perf_counter() - start
+        children = _stack.pop()[0]
+        if _stack:
+            _stack[-1][0] += elapsed
+        _records.append((fullname, elapsed - children, elapsed))
+
+
+def start_import_profiler() -> None:
+    global _started
+    if _started is not None:
+        return
+    _started = time.perf_counter()
+    builtins.__import__ = _timed_import
+
+
+def import_report() -> Tuple[float, List[Tuple[str, float, float]]]:
+    total = sum(self_time for _, self_time, _ in _records)
+    return total, sorted(_records, key=lambda r: r[1], reverse=True)
+
+
+def print_import_report(limit: int = 15) -> None:
+    if _started is None:
+        return
+    builtins.__import__ = _original_import
+    total, records = import_report()
+    wall = time.perf_counter() - _started
+    out = sys.stderr
+    print(f"\n⏱️ Startup profile: {len(records)} modules imported in {total * 1000:.1f} ms (wall {wall * 1000:.1f} ms)", file=out)
+    print(f"{'self ms':>9} {'cumul ms':>9}  module", file=out)
+    for name, self_time, cumulative in records[:limit]:
+        print(f"{self_time * 1000:9.1f} {cumulative * 1000:9.1f}  {name}", file=out)
@@ -1,27 +1,256 @@
 import configparser
-from typing import List
+import hashlib
+import json
+import os
+import re
+from typing import Dict, List, Tuple
 
+from .constants import TEMPLATE_CACHE_PATH
 
-def apply_macros(prompt: str, config: configparser.ConfigParser) -> str:
-    templates = config["templates"] if config.has_section("templates") else None
-    if not templates:
-        return prompt
-    p = prompt.strip()
-    key = None
-    args: List[str] = []
-    if p.startswith(":"):
-        parts = p[1:].split()
-        key = parts[0]
-        args = parts[1:]
-    elif p in templates:
-        key = p
-    if key and key in templates:
-        raw = templates[key]
+# [templates] entries are macros, run with `pu -p ":name args"` without calling the model. Placeholders:
+#   {}              the next positional argument; left as a literal {} when none is left (find -exec ... {} \;)
+#   {0} {1}         a specific positional argument
+#   {name}          name=value, else the next positional argument
+#   {name=default}  the same, falling back to the default
+# {{ and }} are literal braces and ${VAR} is left to the shell. Single-quoted text is taken verbatim,
+# as the shell would, so awk '{print}' {} keeps its braces. Arguments are split like shell words and
+# inserted as typed, quotes included.
+
+CACHE_VERSION = 2
+
+# fields, brace escapes, backslash escapes and quote characters; the quotes are tracked by compile_template
+_TOKEN_RE = re.compile(r"""\{\{|\}\}|\\.|["']|(?<!\$)\{([A-Za-z_][A-Za-z0-9_]*|[0-9]*)(?:=([^{}]*))?\}""", re.DOTALL)
+_ARG_RE = re.compile(r"""(?:[^\s'"\\]|\\.|'[^']*'|"(?:[^"\\]|\\.)*")+""")
+_NAMED_ARG_RE = re.compile(r"^([A-Za-z_][A-Za-z0-9_]*)=(.*)$", re.DOTALL)
+
+
+class TemplateError(ValueError):
+    pass
+
+
+def compile_template(text: str) -> list:
+    # literal strings and [kind, key, default] fields, kind one of "next", "index", "name"; JSON-serializable
+    parts: list = []
+    literal = ""
+    pos = 0
+    in_double = False
+    while True:
+        m = _TOKEN_RE.search(text, pos)
+        if m is None:
+            break
+        literal += text[pos : m.start()]
+        pos = m.end()
+        token = m.group(0)
+        if token == "'" and not in_double:
+            # up to the closing quote, or the end of the template when there is none
+            close = text.find("'", pos)
+            end = len(text) if close < 0 else close + 1
+            literal += token + text[pos:end]
+            pos = end
+            continue
+        if token == '"':
+            in_double = not in_double
+        if token in ("{{", "}}"):
+            literal += token[0]
+            continue
+        if m.group(1) is None:
+            literal += token
+            continue
+        if literal:
+            parts.append(literal)
+            literal = ""
+        key, default = m.group(1), m.group(2)
+        if key == "":
+            parts.append(["next", None, None])
+        elif key.isdigit():
+            parts.append(["index", int(key), None])
+        else:
+            parts.append(["name", key, default])
+    literal += text[pos:]
+    if literal:
+        parts.append(literal)
+    return parts
+
+
+def parameter_names(parts: list) -> List[str]:
+    return list(dict.fromkeys(part[1] for part in parts if not isinstance(part, str) and part[0] == "name"))
+
+
+def split_arguments(text: str) -> List[str]:
+    words: List[str] = []
+    pos = 0
+    for m in _ARG_RE.finditer(text):
+        if text[pos : m.start()].strip():
+            raise TemplateError("Unbalanced quotes in macro arguments")
+        words.append(m.group(0))
+        pos = m.end()
+    if text[pos:].strip():
+        raise TemplateError("Unbalanced quotes in macro arguments")
+    return words
+
+
+def render_template(parts: list, args: List[str], macro: str = "") -> str:
+    names = set(parameter_names(parts))
+    named: Dict[str, str] = {}
+    positional: List[str] = []
+    for arg in args:
+        m = _NAMED_ARG_RE.match(arg)
+        if m is not None and m.group(1) in names:
+            named[m.group(1)] = m.group(2)
+        else:
+            positional.append(arg)
+    used = [False] * len(positional)
+    cursor = 0
+
+    def take() -> str | None:
+        nonlocal cursor
+        while cursor < len(positional) and used[cursor]:
+            cursor += 1
+        if cursor >= len(positional):
+            return None
+        used[cursor] = True
+        return positional[cursor]
+
+    out: List[str] = []
+    for part in parts:
+        if isinstance(part, str):
+            out.append(part)
+            continue
+        kind, key, default = part
+        if kind == "index":
+            if key >= len(positional):
+                raise TemplateError(f":{macro} needs at least {key + 1} arguments")
+            used[key] = True
+            out.append(positional[key])
+        elif kind == "next":
+            value = take()
+            out.append("{}" if value is None else value)
+        else:
+            if key not in named:
+                value = take()
+                if value is None:
+                    value = default
+                if value is None:
+                    raise TemplateError(f":{macro} needs a value for {key} (pass {key}=...)")
+                named[key] = value
+            out.append(named[key])
+    extra = [arg for arg, taken in zip(positional, used) if not taken]
+    if extra:
+        raise TemplateError(f":{macro} got unused arguments: {' '.join(extra)}")
+    return "".join(out)
+
+
+class MacroTrie:
+    # prefix lookup of macro names, so `:git-c` finds git-clean without scanning every entry
+    _END = "\0"
+
+    def __init__(self, names):
+        self.root: dict = {}
+        for name in names:
+            node = self.root
+            for ch in name:
+                node = node.setdefault(ch, {})
+            node[self._END] = name
+
+    def complete(self, prefix: str) -> List[str]:
+        node = self.root
+        for ch in prefix:
+            node = node.get(ch)
+            if node is None:
+                return []
+        names: List[str] = []
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            for ch, child in node.items():
+                if ch == self._END:
+                    names.append(child)
+                else:
+                    stack.append(child)
+        return sorted(names)
+
+
+class MacroSet:
+    def __init__(self, compiled: Dict[str, list]):
+        self.compiled = compiled
+        self.trie = MacroTrie(compiled)
+
+    def resolve(self, name: str) -> List[str]:
+        # the exact name, else every macro it is a prefix of
+        return [name] if name in self.compiled else self.trie.complete(name)
+
+
+_loaded: Tuple[str, MacroSet] | None = None
+
+
+def _digest(items: List[Tuple[str, str]]) -> str:
+    return hashlib.sha256(json.dumps([CACHE_VERSION, items]).encode("utf-8")).hexdigest()
+
+
+def _template_names(config: configparser.ConfigParser) -> List[str]:
+    return config.options("templates") if config.has_section("templates") else []
+
+
+def load_macros(config: configparser.ConfigParser) -> MacroSet | None:
+    # compiled templates are kept in ~/.pu_templates.json and reused until the section changes
+    global _loaded
+    names = _template_names(config)
+    # raw: % is common in shell commands (date +%F) and is not configparser interpolation here
+    items = [(name, config.get("templates", name, raw=True)) for name in names]
+    if not items:
+        return None
+    digest = _digest(items)
+    if _loaded is not None and _loaded[0] == digest:
+        return _loaded[1]
+    compiled = None
+    try:
+        with open(TEMPLATE_CACHE_PATH, "r") as f:
+            data = json.load(f)
+        if isinstance(data, dict) and data.get("digest") == digest:
+            compiled = data.get("templates")
+    except (OSError, ValueError):
+        pass
+    if not isinstance(compiled, dict):
+        compiled = {name: compile_template(text) for name, text in items}
+        tmp = TEMPLATE_CACHE_PATH.with_name(f"{TEMPLATE_CACHE_PATH.name}.{os.getpid()}.tmp")
         try:
-            expanded = raw.format(*args)
-        except Exception:
-            expanded = raw
-        return expanded
-    return prompt
+            fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w") as f:
+                json.dump({"digest": digest, "templates": compiled}, f)
+            os.replace(tmp, TEMPLATE_CACHE_PATH)
+        except OSError:
+            pass
+    _loaded = (digest, MacroSet(compiled))
+    return _loaded[1]
 
 
+def expand_macro(prompt: str, config: configparser.ConfigParser) -> Tuple[str, str] | None:
+    # (macro name, command) for ":name args" or a prompt that is exactly a macro name; None when the
+    # prompt is not a macro. Unknown or ambiguous names and bad arguments raise TemplateError.
+    p = prompt.strip()
+    if not p.startswith(":"):
+        name = config.optionxform(p)
+        if name not in _template_names(config):
+            return None
+        macros = load_macros(config)
+        return name, render_template(macros.compiled[name], [], name)
+    head, rest = (p[1:].split(None, 1) + ["", ""])[:2]
+    name = config.optionxform(head)
+    macros = load_macros(config)
+    matches = macros.resolve(name) if macros is not None and name else []
+    if not matches:
+        available = ", ".join(sorted(macros.compiled)) if macros is not None else "none configured in [templates]"
+        raise TemplateError(f"No macro named :{head} (available: {available})")
+    if len(matches) > 1:
+        raise TemplateError(f":{head} matches several macros: " + ", ".join(f":{m}" for m in matches))
+    name = matches[0]
+    return name, render_template(macros.compiled[name], split_arguments(rest), name)
+
+
+def apply_macros(prompt: str, config: configparser.ConfigParser) -> str:
+    # the expanded command, or the prompt unchanged when it is not a macro that expands cleanly
+    try:
+        macro = expand_macro(prompt, config)
+    except TemplateError:
+        return prompt
+    return prompt if macro is None else macro[1]
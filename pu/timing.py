@@ -0,0 +1,67 @@
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+# phases in the order a run goes through them; pu stats lists them in this order
+PHASES = ["config", "template", "context", "cache", "local", "daemon", "client", "provider", "first_token", "backoff", "risk", "confirm", "execute", "total"]
+
+
+class Timings:
+    # wall time per phase of one pu run in milliseconds; spans with the same name accumulate,
+    # so a phase entered several times (retries, repeated prompts) reports its total
+    def __init__(self):
+        self.phases: Dict[str, float] = {}
+        self.retries = 0
+        self.usage: Dict[str, int] = {}
+        self.model: str | None = None
+        # which configured endpoint answered, and whether a hedge request was sent
+        self.endpoint: str | None = None
+        self.hedged = False
+        # pu.prompts.PROMPT_VERSION of the request sent to the model, None when no request was made
+        self.prompt_version: str | None = None
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - start) * 1000)
+
+    def add(self, name: str, ms: float) -> None:
+        self.phases[name] = self.phases.get(name, 0.0) + ms
+
+    def add_usage(self, usage) -> None:
+        # accepts the SDK usage object or a plain dict; missing fields are skipped. cached_tokens is
+        # the part of the prompt the provider served from its prompt cache (prompt_tokens_details)
+        get = usage.get if isinstance(usage, dict) else (lambda field: getattr(usage, field, None))
+        counts = {field: get(field) for field in ("prompt_tokens", "completion_tokens", "total_tokens", "cached_tokens")}
+        details = get("prompt_tokens_details")
+        if counts["cached_tokens"] is None and details is not None:
+            counts["cached_tokens"] = details.get("cached_tokens") if isinstance(details, dict) else getattr(details, "cached_tokens", None)
+        if isinstance(counts["prompt_tokens"], int) and isinstance(counts["cached_tokens"], int):
+            counts["uncached_tokens"] = counts["prompt_tokens"] - counts["cached_tokens"]
+        for field, value in counts.items():
+            if isinstance(value, int):
+                self.usage[field] = self.usage.get(field, 0) + value
+
+    def as_dict(self) -> dict:
+        phases = {name: round(ms, 1) for name, ms in self.phases.items()}
+        phases["total"] = round((time.perf_counter() - self._start) * 1000, 1)
+        data = {"timings_ms": phases, "retries": self.retries, "usage": dict(self.usage), "model": self.model, "endpoint": self.endpoint, "hedged": self.hedged}
+        if self.prompt_version:
+            data["prompt_version"] = self.prompt_version
+        return data
+
+    def merge(self, data: dict) -> None:
+        # folds in the provider-side measurements a pu daemon sends back
+        for name, ms in (data.get("timings_ms") or {}).items():
+            if name != "total":
+                self.add(name, ms)
+        self.retries += data.get("retries") or 0
+        self.add_usage(data.get("usage") or {})
+        self.model = data.get("model") or self.model
+        self.endpoint = data.get("endpoint") or self.endpoint
+        self.hedged = self.hedged or bool(data.get("hedged"))
+        self.prompt_version = data.get("prompt_version") or self.prompt_version